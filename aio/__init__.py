@@ -0,0 +1,89 @@
+'''
+    Async (ASGI) serving mode
+    The same endpoints and JSON responses as the Flask app, served by Quart
+    handlers that await the database (aiosqlite) and the calorie provider
+    (httpx), so a slow Nutritionix call does not hold a worker thread.
+
+    hypercorn asgi:app --workers 1
+'''
+import os
+import time
+import httpx
+from quart import Quart, g, request
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from config import Config
+import foods
+import metrics
+import nutrition
+import shared_state
+from sharding import read_shard_count, shard_directory
+from models.nutrition import NutritionFact
+
+INSTANCE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance')
+
+
+def async_database_url(uri, instance_path=INSTANCE_PATH):
+    '''
+        sqlite:///database.db -> sqlite+aiosqlite:///<instance>/database.db,
+        relative paths are resolved against the instance folder like Flask-SQLAlchemy does
+    '''
+    url = make_url(uri)
+    if url.get_backend_name() != 'sqlite':
+        raise ValueError(f'Async mode only supports SQLite, got {url.drivername}')
+    database = url.database
+    if database and database != ':memory:' and not os.path.isabs(database):
+        database = os.path.join(instance_path, database)
+    return url.set(drivername='sqlite+aiosqlite', database=database)
+
+
+def create_app(config=Config):
+    app = Quart(__name__, instance_path=INSTANCE_PATH)
+    app.config.from_object(config)
+    shared_state.init_app(app)
+    foods.init_app(app)
+    if read_shard_count(shard_directory(app)):
+        raise RuntimeError('Sharded entry storage is not supported in async mode, use the Flask app')
+
+    @app.before_serving
+    async def open_resources():
+        app.engine = create_async_engine(async_database_url(app.config['SQLALCHEMY_DATABASE_URI']))
+        app.session_factory = async_sessionmaker(app.engine, expire_on_commit=False)
+        app.http_client = httpx.AsyncClient(timeout=app.config.get('NUTRITIONIX_TIMEOUT', 5))
+        async with app.session_factory() as session:
+            facts = (await session.execute(select(NutritionFact.__table__))).all()
+        nutrition.load_index(facts)
+
+    @app.after_serving
+    async def close_resources():
+        await app.http_client.aclose()
+        await app.engine.dispose()
+
+    @app.before_request
+    async def open_session():
+        g._metrics_start = time.perf_counter()
+        g.session = app.session_factory()
+
+    @app.after_request
+    async def record_request(response):
+        start = g.pop('_metrics_start', None)
+        if start is not None and app.config.get('METRICS_ENABLED', True):
+            metrics.observe_request(*metrics.route_labels(request), response.status_code, time.perf_counter() - start)
+        return response
+
+    @app.teardown_request
+    async def close_session(exception):
+        session = g.pop('session', None)
+        if session is not None:
+            await session.close()
+
+    from .auth import auth_bp
+    from .entry import entry_bp
+    from .user import users_bp
+    from .monitoring import metrics_bp
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(entry_bp)
+    app.register_blueprint(users_bp)
+    app.register_blueprint(metrics_bp)
+    return app
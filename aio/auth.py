@@ -0,0 +1,104 @@
+'''
+    Async routes related to authentication, see routes/auth.py
+'''
+import asyncio
+from functools import wraps
+import jwt
+from quart import Blueprint, request, jsonify, current_app, g
+from sqlalchemy import select
+from werkzeug.security import generate_password_hash, check_password_hash
+from models.user import User
+
+'''blueprint for auth'''
+auth_bp = Blueprint('auth', __name__)
+
+
+@auth_bp.route('/register', methods=['POST'])
+async def register():
+    data = await request.get_json()
+    name = str(data.get('name'))
+    email = str(data.get('email'))
+    password = str(data.get('password'))
+    role = str(data.get('role')) or 'regular'
+
+    if role != 'regular' and role != 'manager' and role != 'admin':
+        return jsonify({'message': 'Invalid role'}), 400
+
+    # Validate input
+    if not name or not email or not password:
+        return jsonify({'message': 'Invalid input'}), 400
+
+    # Check if the user already exists
+    existing_user = (await g.session.execute(select(User).filter_by(email=email))).scalars().first()
+    if existing_user:
+        return jsonify({'message': 'User already exists'}), 409
+
+    # Hashing is CPU bound, keep it off the event loop
+    hashed_password = await asyncio.to_thread(generate_password_hash, password)
+    new_user = User(name=name, email=email, password_hash=hashed_password, role=role)
+    g.session.add(new_user)
+    await g.session.commit()
+
+    return jsonify({'message': 'registered successfully'}), 201
+
+
+@auth_bp.route('/login', methods=['POST'])
+async def login():
+    data = await request.get_json()
+    email = str(data.get('email'))
+    password = str(data.get('password'))
+
+    if not email or not password:
+        return jsonify({'message': 'Invalid input'}), 400
+
+    user = (await g.session.execute(select(User).filter_by(email=email))).scalars().first()
+
+    if not user:
+        return jsonify({'message': 'User does not exist'}), 404
+
+    if not await asyncio.to_thread(check_password_hash, user.password_hash, password):
+        return jsonify({'message': 'Invalid credentials'}), 401
+
+    access_token = generate_access_token(user)
+
+    return jsonify({'access_token': access_token}), 200
+
+
+def generate_access_token(user):
+    '''generate access token'''
+    payload = {
+        'user_id': user.id,
+        'name': user.name,
+        'email': user.email,
+        'role': user.role
+    }
+    secret_key = current_app.config['SECRET_KEY']
+    return jwt.encode(payload, secret_key, algorithm='HS256')
+
+
+# Decorator to check if the request is from an authenticated user
+def login_required(func):
+    @wraps(func)
+    async def decorated_function(*args, **kwargs):
+        access_token = request.headers.get('Authorization')
+
+        if not access_token:
+            return jsonify({'message': 'Missing access token'}), 401
+
+        try:
+            secret_key = current_app.config['SECRET_KEY']
+            payload = jwt.decode(access_token, secret_key, algorithms=['HS256'])
+            current_user = await g.session.get(User, payload.get('user_id'))
+            if not current_user:
+                return jsonify({"message": "Invalid user"}), 401
+
+            g.current_user = current_user
+
+        except jwt.ExpiredSignatureError:
+            return jsonify({'message': 'Expired access token'}), 401
+        except jwt.InvalidTokenError:
+            return jsonify({'message': 'Invalid access token'}), 401
+
+        return await func(*args, **kwargs)
+
+    return decorated_function
@@ -0,0 +1,210 @@
+'''
+    Async routes related to entries, see routes/entry.py
+'''
+from datetime import date, datetime
+from quart import Blueprint, request, jsonify, g
+from sqlalchemy import select
+from models.entry import Entry
+from models import entry_change
+from models import archive
+from models.archive import ArchivedEntry
+from models.user import User
+import formats
+import records
+from .auth import login_required
+from .helpers import entry_table, food_calories, intern_food, list_response, paginate, serialize_entries
+
+# Create a blueprint for entry routes
+entry_bp = Blueprint("entry_bp", __name__)
+
+
+async def _find_entry(current_user, entry_id, restore=False):
+    '''
+        admins can reach any entry, other roles only their own; archived entries
+        are returned read only, or moved back into entries first when restore is set
+    '''
+    for model in (Entry, ArchivedEntry):
+        statement = select(model).filter_by(id=entry_id)
+        if current_user.role == 'regular' or current_user.role == 'manager':
+            statement = statement.filter_by(user_id=current_user.id)
+        entry = (await g.session.execute(statement)).scalars().first()
+        if entry:
+            if model is ArchivedEntry and restore:
+                for restore_statement in archive.restore_statements(entry):
+                    await g.session.execute(restore_statement)
+                await g.session.commit()
+                g.session.expunge(entry)
+                return await g.session.get(Entry, entry.id)
+            return entry
+    return None
+
+
+async def _calories(food_id, calories):
+    '''
+        calories sent by the client, or those of the food; awaited before the entry is
+        changed, the session has nothing to flush while the provider is called
+    '''
+    if calories is None:
+        calories = await food_calories(food_id)
+    return calories
+
+
+async def _save(entry):
+    g.session.add(entry)
+    await g.session.commit()
+
+
+@entry_bp.route("/entries", methods=["GET"])
+@login_required
+async def get_entries():
+    """Get all entries."""
+    current_user = g.current_user
+    page = request.args.get("page", default=1, type=int)
+    per_page = request.args.get("per_page", default=10, type=int)
+    user_name = request.args.get("username")
+    food = request.args.get("food")
+    start_date = request.args.get("start_date", type=date.fromisoformat)
+    end_date = request.args.get("end_date", type=date.fromisoformat)
+    if formats.shape(request.args) is None:
+        return jsonify(formats.invalid_format_message()), 400
+
+    horizon = (await g.session.execute(archive.horizon_statement())).scalar()
+    source = archive.entry_source(archive.needs_archive(horizon, start_date))
+    statement = records.entries_statement(source, current_user, user_name, food, start_date, end_date)
+    entries = await paginate(statement, page, per_page)
+
+    if formats.columnar(request.args):
+        result = await entry_table(entries.items)
+    else:
+        result = await serialize_entries(entries.items)
+    return list_response({
+        "entries": result,
+        "total_entries": entries.total,
+        "current_page": entries.page,
+        "per_page": entries.per_page,
+        "has_next": entries.has_next,
+        "has_prev": entries.has_prev
+    })
+
+
+@entry_bp.route("/entries/changes", methods=["GET"])
+@login_required
+async def get_entry_changes():
+    """Get the changes of entries since a cursor."""
+    current_user = g.current_user
+    limit = min(request.args.get("limit", default=100, type=int), 1000)
+    cursor = entry_change.parse_cursor(request.args.get("since"), 1)
+    if cursor is None or limit < 1:
+        return jsonify({"message": "Invalid since or limit"}), 400
+    if len(cursor) != 1:
+        return jsonify({"message": "Sync cursor expired, sync again from since=0"}), 410
+
+    since = cursor[0]
+    reset = (await g.session.execute(entry_change.reset_statement())).scalar() or 0
+    if 0 < since < reset:
+        return jsonify({"message": "Sync cursor expired, sync again from since=0"}), 410
+
+    user_id = None if current_user.role == "admin" else current_user.id
+    rows = (await g.session.execute(entry_change.feed_statement(since, user_id, limit + 1))).scalars().all()
+    changes, cursor, has_more = entry_change.merge_feeds({0: rows}, cursor, limit)
+
+    ids = [change.entry_id for change in changes if change.op == 'upsert']
+    rows = (await g.session.execute(records.entries_by_id(ids))).all() if ids else []
+    entries = dict(zip([row.id for row in rows], await serialize_entries(rows)))
+    return jsonify({
+        "changes": entry_change.serialize_changes(changes, entries),
+        "next_since": entry_change.format_cursor(cursor),
+        "has_more": has_more
+    })
+
+
+@entry_bp.route("/entries/<entry_id>", methods=["GET"])
+@login_required
+async def get_entry(entry_id):
+    """Get a specific entry."""
+    entry = await _find_entry(g.current_user, entry_id)
+    if not entry:
+        return jsonify({"message": "Entry not found"}), 404
+
+    return jsonify((await serialize_entries([records.entry_values(entry)]))[0])
+
+
+@entry_bp.route("/entries", methods=["POST"])
+@login_required
+async def create_entry():
+    """Create a new entry."""
+    data = await request.get_json()
+    current_user = g.current_user
+    user_id = None
+    if current_user:
+        user_id = current_user.id
+    else:
+        user_id = data.get("user_id")
+
+    if not user_id:
+        return jsonify({"message": "User not found"}), 404
+
+    user = await g.session.get(User, user_id)
+    if not user:
+        return jsonify({"message": "User not found"}), 404
+
+    _date = data.get('date')
+    _time = data.get('time')
+
+    if _date is None:
+        _date = date.today()
+    if _time is None:
+        _time = datetime.now().time()
+
+    food_id = await intern_food(data.get("text"))
+    entry = Entry(
+        date=_date,
+        time=_time,
+        food_id=food_id,
+        calories=await _calories(food_id, data.get("calories")),
+        user_id=user_id
+    )
+    await _save(entry)
+    return jsonify((await serialize_entries([records.entry_values(entry)]))[0]), 201
+
+
+@entry_bp.route("/entries/<entry_id>", methods=["PUT"])
+@login_required
+async def update_entry(entry_id):
+    """Update a specific entry."""
+    entry = await _find_entry(g.current_user, entry_id, restore=True)
+    if not entry:
+        return jsonify({"message": "Entry not found"}), 404
+
+    data = await request.get_json()
+    food_id = await intern_food(data["text"]) if "text" in data else entry.food_id
+    calories = await _calories(food_id, data.get("calories"))
+
+    date_str = data.get("date", entry.date)
+    if date_str is None:
+        date_str = date.today()
+
+    time_str = data.get("time", entry.time)
+    if time_str is None:
+        time_str = datetime.now().time()
+
+    entry.date = date_str
+    entry.time = time_str
+    entry.food_id = food_id
+    entry.calories = calories
+    await _save(entry)
+
+    return jsonify((await serialize_entries([records.entry_values(entry)]))[0])
+
+
+@entry_bp.route("/entries/<entry_id>", methods=["DELETE"])
+@login_required
+async def delete_entry(entry_id):
+    """Delete a specific entry."""
+    entry = await _find_entry(g.current_user, entry_id, restore=True)
+    if not entry:
+        return jsonify({"message": "Entry not found"}), 404
+
+    await g.session.delete(entry)
+    await g.session.commit()
+    return jsonify({"message": "Entry deleted"}), 200
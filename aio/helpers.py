@@ -0,0 +1,170 @@
+'''
+    Shared helpers of the async app: pagination, daily totals, foods and calorie lookup
+'''
+import asyncio
+import time
+import httpx
+from quart import current_app, g, jsonify, request
+from sqlalchemy import select, update
+import foods
+import formats
+import metrics
+import nutrition
+import records
+import pagination
+from models.food import Food
+
+
+async def paginate(statement, page, per_page):
+    '''pagination.paginate on the request session'''
+    pagination.check_page(page, per_page)
+    total = (await g.session.execute(pagination.count_statement(statement))).scalar()
+    items = (await g.session.execute(pagination.page_statement(statement, page, per_page))).all()
+    return pagination.page_of(items, total, page, per_page)
+
+
+async def daily_totals(pairs):
+    '''records.daily_totals on the request session'''
+    if not pairs:
+        return {}
+    return records.add_daily_totals(*[
+        (await g.session.execute(statement)).all() for statement in records.daily_total_statements(pairs)
+    ])
+
+
+async def limit_flags(entries):
+    '''
+        is_calorie_intake_less_than_expected of each entry (records.EntryRow) with one query
+        for all daily totals and limits, see records.limit_flags
+    '''
+    looked_up = await foods_calories({entry.food_id for entry in entries if entry.calories is None})
+    own = [looked_up.get(entry.food_id) or 0 if entry.calories is None else 0 for entry in entries]
+    pairs = {(entry.user_id, entry.date) for entry in entries}
+    totals = await daily_totals(pairs)
+    user_ids = {user_id for user_id, _ in pairs}
+    expected = {}
+    if user_ids:
+        expected = dict((await g.session.execute(records.expected_statement(user_ids))).all())
+    return records.flags([entry.user_id for entry in entries], [entry.date for entry in entries], own, totals, expected)
+
+
+async def serialize_entries(rows):
+    '''records.serialize_entries: rows in the order of records.entry_columns (records.entry_values of an Entry)'''
+    entries = [records.EntryRow(*row) for row in rows]
+    texts = await load_foods({entry.food_id for entry in entries})
+    flags = await limit_flags(entries)
+    return [entry.serialize(flag, texts[entry.food_id]) for entry, flag in zip(entries, flags)]
+
+
+async def entry_table(rows):
+    '''rows column-wise for ?format=columnar, see records.entry_table'''
+    texts = await load_foods({row.food_id for row in rows})
+    flags = await limit_flags([records.EntryRow(*row) for row in rows])
+    return records.entry_table(rows, flags, texts)
+
+
+def list_response(payload):
+    '''response of a list payload in the encoding the request asks for, see formats.response'''
+    encoding = formats.mimetype(request.accept_mimetypes)
+    if encoding != formats.JSON:
+        result = current_app.response_class(formats.pack(payload), mimetype=encoding)
+    else:
+        result = jsonify(payload)
+    result.vary.add('Accept')
+    return result
+
+
+async def load_foods(food_ids):
+    '''{food_id: text} of the given foods, see foods.load'''
+    texts, missing = foods.cached(food_ids)
+    if missing:
+        rows = (await g.session.execute(foods.texts_statement(missing))).all()
+        foods.remember(rows)
+        texts.update(rows)
+    return texts
+
+
+async def intern_food(text):
+    '''id of a text, added to the foods dictionary (and committed) when new, see foods.intern'''
+    if text is None:
+        return None
+    food_id = foods.cached_id(text)
+    if food_id is None:
+        await g.session.execute(foods.intern_statement(text))
+        food_id = (await g.session.execute(foods.id_statement(text))).scalar()
+        await g.session.commit()
+        foods.remember([(food_id, text)])
+    return food_id
+
+
+async def foods_calories(food_ids):
+    '''
+        {food_id: calories} of the given foods, resolved and stored on first use (see
+        foods.calories_of). The transaction of the request session ends before the
+        provider is awaited, so requests waiting on Nutritionix hold no database
+        connection; the session must not have unflushed changes
+    '''
+    food_ids = {food_id for food_id in food_ids if food_id is not None}
+    if not food_ids:
+        return {}
+    texts = await load_foods(food_ids)
+    rows = await g.session.execute(select(Food.id, Food.calories).where(Food.id.in_(food_ids)))
+    calories = {food_id: value for food_id, value in rows if value is not None}
+    unresolved = sorted(food_ids - calories.keys())
+    await g.session.commit()
+    if not unresolved:
+        return calories
+
+    resolved = await asyncio.gather(*(resolve_calories(texts[food_id]) for food_id in unresolved))
+    final = {}
+    for food_id, (value, is_final) in zip(unresolved, resolved):
+        calories[food_id] = value
+        if is_final and value is not None:
+            final[food_id] = value
+    if final:
+        for food_id, value in final.items():
+            await g.session.execute(update(Food).where(Food.id == food_id).values(calories=value))
+        await g.session.commit()
+    return calories
+
+
+async def food_calories(food_id):
+    return (await foods_calories([food_id])).get(food_id)
+
+
+async def fetch_nutritionix_calories(text):
+    '''non-blocking version of nutrition.fetch_nutritionix_calories'''
+    config = current_app.config
+    api_url, kwargs = nutrition.nutritionix_request(text, config)
+    kwargs.pop('timeout')
+    start = time.perf_counter()
+    calories = None
+    try:
+        response = await current_app.http_client.post(api_url, **kwargs)
+        if response.status_code == 200:
+            calories = response.json()['foods'][0]['nf_calories']
+            outcome = 'success'
+        else:
+            outcome = 'http_error'
+    except httpx.HTTPError:
+        outcome = 'network_error'
+    metrics.observe_provider('nutritionix', outcome, time.perf_counter() - start)
+    return calories
+
+
+async def resolve_calories(text):
+    '''local table, then Nutritionix, then the best local guess; (calories, final) like nutrition.resolve_calories'''
+    config = current_app.config
+    calories, confidence, confident = nutrition.local_calories(text, config)
+    if confident:
+        return round(calories), True
+
+    # the cache and the rate limit are in the shared state file (sqlite3, waits up to
+    # 5 seconds on its lock), so they are read and written off the event loop
+    remote = await asyncio.to_thread(nutrition.cached_nutritionix_calories, text)
+    if remote is None and await asyncio.to_thread(nutrition.nutritionix_allowed, config):
+        remote = await fetch_nutritionix_calories(text)
+        await asyncio.to_thread(nutrition.remember_nutritionix_calories, text, remote, config)
+    if remote is not None:
+        return remote, True
+    return nutrition.fallback_calories(calories, confidence, config), False
@@ -0,0 +1,14 @@
+'''
+    Async route for monitoring, see routes/metrics.py
+'''
+from quart import Blueprint, Response
+import metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+async def get_metrics():
+    """Expose metrics in the Prometheus text format."""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
@@ -0,0 +1,145 @@
+'''
+    Async routes related to users, see routes/user.py
+'''
+import asyncio
+from quart import Blueprint, request, jsonify, g
+from sqlalchemy import select
+from werkzeug.security import generate_password_hash
+from models.user import User
+import formats
+import records
+from .auth import login_required
+from .helpers import list_response, paginate
+
+# Create blueprint for users routes
+users_bp = Blueprint('users', __name__, url_prefix='/users')
+
+
+@users_bp.route('/create', methods=['POST'])
+@login_required
+async def create_user():
+    """Create a new user."""
+    current_user = g.current_user
+    if current_user.role == 'regular':
+        return jsonify({'message': 'Unauthorized'}), 401
+
+    data = await request.get_json()
+    name = data.get('name')
+    email = data.get('email')
+    password = data.get('password')
+    role = data.get('role') or 'regular'
+
+    if role not in ('regular', 'admin', 'manager'):
+        return jsonify({'message': 'Invalid role'}), 400
+
+    if not name or not email or not password:
+        return jsonify({'message': 'Invalid input'}), 400
+
+    existing_user = (await g.session.execute(select(User).filter_by(email=email))).scalars().first()
+    if existing_user:
+        return jsonify({'message': 'User already exists'}), 409
+
+    hashed_password = await asyncio.to_thread(generate_password_hash, password)
+
+    new_user = User(name=name, email=email, password_hash=hashed_password, role=role)
+    g.session.add(new_user)
+    await g.session.commit()
+    return jsonify(new_user.serialize()), 201
+
+
+@users_bp.route('/<user_id>', methods=['GET'])
+@login_required
+async def get_user(user_id):
+    """Get a specific user."""
+    current_user = g.current_user
+    if current_user.role == 'admin' or current_user.role == 'manager':
+        user = await g.session.get(User, user_id)
+        if not user:
+            return jsonify({'message': 'User not found'}), 404
+
+        return jsonify(user.serialize())
+
+    return jsonify({'message': 'Unauthorized'}), 401
+
+
+@users_bp.route('/list', methods=['GET'])
+@login_required
+async def get_users():
+    """Get a list of users."""
+    current_user = g.current_user
+    if current_user.role == 'regular':
+        return jsonify({'message': 'Unauthorized'}), 401
+
+    page = request.args.get('page', default=1, type=int)
+    per_page = request.args.get('per_page', default=10, type=int)
+    username = request.args.get('username')
+    email = request.args.get('email')
+    user_role = request.args.get('role')
+    if formats.shape(request.args) is None:
+        return jsonify(formats.invalid_format_message()), 400
+    users = await paginate(records.users_statement(username, email, user_role), page, per_page)
+
+    if formats.columnar(request.args):
+        serialized_users = records.user_table(users.items)
+    else:
+        serialized_users = records.serialize_users(users.items)
+    return list_response({
+        'users': serialized_users,
+        'total_users': users.total,
+        'current_page': users.page,
+        'per_page': users.per_page,
+        'total_pages': users.pages,
+        'has_next': users.has_next,
+        'has_prev': users.has_prev
+    })
+
+
+@users_bp.route('/<user_id>', methods=['PUT'])
+@login_required
+async def update_user(user_id):
+    """Update a specific user."""
+    current_user = g.current_user
+
+    if current_user.role == 'regular':
+        return jsonify({'message': 'Unauthorized'}), 401
+
+    user = await g.session.get(User, user_id)
+    if not user:
+        return jsonify({'message': 'User not found'}), 404
+
+    data = await request.get_json()
+    user.name = data.get('name', user.name)
+    user.email = data.get('email', user.email)
+    user.role = data.get('role', user.role)
+    await g.session.commit()
+
+    return jsonify(user.serialize())
+
+
+@users_bp.route('/<user_id>', methods=['DELETE'])
+@login_required
+async def delete_user(user_id):
+    current_user = g.current_user
+
+    user = await g.session.get(User, user_id)
+    if not user:
+        return jsonify({'message': 'User not found'}), 404
+
+    if current_user.role == 'admin' or (current_user.role == 'manager' and user.role == 'regular'):
+        await g.session.delete(user)
+        await g.session.commit()
+        return jsonify({'message': 'User deleted'})
+
+    return jsonify({'message': 'Unauthorized'}), 401
+
+
+@users_bp.route('/expected-calories', methods=['PUT'])
+@login_required
+async def set_expected_calories():
+    """Set the expected number of calories per day for a user."""
+    user = g.current_user
+    data = await request.get_json()
+    user.expected_daily_calories = data.get('expected_daily_calories')
+    await g.session.commit()
+
+    return jsonify({'message': 'Expected calories per day updated'})
@@ -11,6 +11,15 @@ from models.user import User
 from routes.auth import auth_bp
 from routes.entry import entry_bp
 from routes.user import users_bp
+from routes.metrics import metrics_bp
+import metrics
+import profiling
+import nutrition
+import shared_state
+import sharding
+import archive
+import foods
+from loadtest import loadtest_command
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -19,6 +28,14 @@ app.config['FLASK_DEBUG'] = app.config['DEBUG']
 db.init_app(app)
 bcrypt = Bcrypt(app)
 migrate = Migrate(app, db)
+metrics.init_app(app)
+profiling.init_app(app)
+nutrition.init_app(app)
+shared_state.init_app(app)
+sharding.init_app(app)
+archive.init_app(app)
+foods.init_app(app)
+app.cli.add_command(loadtest_command)
 
 
 
@@ -26,6 +43,7 @@ migrate = Migrate(app, db)
 app.register_blueprint(auth_bp)
 app.register_blueprint(entry_bp)
 app.register_blueprint(users_bp)
+app.register_blueprint(metrics_bp)
 
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -0,0 +1,114 @@
+'''
+    Hot/cold partitioning of entries
+    "flask archive run" moves entries dated before the cutoff (ARCHIVE_AFTER_DAYS
+    ago by default) from entries into archived_entries, in every database that
+    holds entries (the main one or each shard), and adds their calories to
+    archived_daily_totals so the daily limit flag of an archived day costs one
+    primary key lookup. The entries table and its indexes keep only recent data.
+
+    Reads include the archive when they need it: GET /entries with a
+    start_date after the newest archived day only touches entries.
+    Archived entries keep their ids and stay in the change feed; updating or
+    deleting one moves it back into entries first.
+'''
+from datetime import date, timedelta
+import click
+import sqlalchemy as sa
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy.dialects.sqlite import insert
+from models import db
+from models.archive import ArchivedDailyTotal, ArchivedEntry
+from models.entry import Entry
+from models.entry_change import EntryChange
+import sharding
+
+archive_cli = AppGroup('archive', help='Move old entries into the archive tables.')
+
+
+def cutoff_date(days):
+    '''entries dated before this day are archived'''
+    return date.today() - timedelta(days=days)
+
+
+def archive_batch(connection, cutoff, batch):
+    '''
+        move up to `batch` entries dated before cutoff, in the caller's transaction;
+        returns the number of entries moved
+    '''
+    entries = Entry.__table__
+    archived = ArchivedEntry.__table__
+    totals = ArchivedDailyTotal.__table__
+    changes = EntryChange.__table__
+
+    # entries is AUTOINCREMENT, ids moved out of it are not handed out again
+    ids = connection.execute(
+        sa.select(entries.c.id).where(entries.c.date < cutoff).order_by(entries.c.id).limit(batch)
+    ).scalars().all()
+    if not ids:
+        return 0
+    moving = entries.c.id.in_(ids)
+
+    connection.execute(archived.insert().from_select(
+        [column.name for column in entries.columns], sa.select(*entries.columns).where(moving)
+    ))
+    day_totals = sa.select(entries.c.user_id, entries.c.date, sa.func.coalesce(sa.func.sum(entries.c.calories), 0)) \
+        .where(moving).group_by(entries.c.user_id, entries.c.date)
+    for user_id, day, calories in connection.execute(day_totals).all():
+        connection.execute(
+            insert(totals).values(user_id=user_id, date=day, calories=calories)
+            .on_conflict_do_update(index_elements=[totals.c.user_id, totals.c.date],
+                                   set_={'calories': totals.c.calories + calories})
+        )
+
+    # archiving is not a change for sync clients: the delete triggers write tombstones,
+    # which are replaced by the change rows the entries had before
+    kept = connection.execute(sa.select(changes).where(changes.c.entry_id.in_(ids))).all()
+    last_seq = connection.execute(sa.select(sa.func.max(changes.c.seq))).scalar() or 0
+    connection.execute(entries.delete().where(moving))
+    connection.execute(changes.delete().where(changes.c.seq > last_seq))
+    if kept:
+        connection.execute(changes.insert(), [row._asdict() for row in kept])
+    return len(ids)
+
+
+def archive_database(engine, cutoff, batch):
+    moved = 0
+    while True:
+        with engine.begin() as connection:
+            count = archive_batch(connection, cutoff, batch)
+        moved += count
+        if count < batch:
+            return moved
+
+
+@archive_cli.command('run')
+@click.option('--days', type=click.IntRange(min=1), default=None,
+              help='Archive entries older than this many days [default: ARCHIVE_AFTER_DAYS].')
+@click.option('--batch', default=1000, show_default=True, help='Entries moved per transaction.')
+def run(days, batch):
+    '''move entries older than the cutoff into the archive'''
+    days = days or current_app.config.get('ARCHIVE_AFTER_DAYS', 180)
+    cutoff = cutoff_date(days)
+    engines = sharding.engines() or [db.engine]
+    for index, engine in enumerate(engines):
+        moved = archive_database(engine, cutoff, batch)
+        name = f'shard {index}' if sharding.enabled() else 'main database'
+        click.echo(f'{name}: archived {moved} entries dated before {cutoff}')
+
+
+@archive_cli.command('status')
+def status():
+    '''hot and archived entries per database'''
+    engines = sharding.engines() or [db.engine]
+    for index, engine in enumerate(engines):
+        with engine.connect() as connection:
+            hot = connection.execute(sa.select(sa.func.count()).select_from(Entry.__table__)).scalar()
+            cold = connection.execute(sa.select(sa.func.count()).select_from(ArchivedEntry.__table__)).scalar()
+            horizon = connection.execute(sa.select(sa.func.max(ArchivedDailyTotal.date))).scalar()
+        name = f'shard {index}' if sharding.enabled() else 'main database'
+        click.echo(f'{name}: {hot} entries, {cold} archived (up to {horizon or "-"})')
+
+
+def init_app(app):
+    app.cli.add_command(archive_cli)
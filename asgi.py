@@ -0,0 +1,7 @@
+'''
+    ASGI entry point for the async serving mode
+    > hypercorn asgi:app --bind 0.0.0.0:5000
+'''
+from aio import create_app
+
+app = create_app()
@@ -1,4 +1,54 @@
+import os
+
 class Config:
     DEBUG = True
     SECRET_KEY = 'my-secret-key'
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///database.db'
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///database.db')
+
+    # calorie provider, the url can be pointed at a stub (see "flask loadtest")
+    NUTRITIONIX_API_URL = os.environ.get('NUTRITIONIX_API_URL', 'https://trackapi.nutritionix.com/v2/natural/nutrients')
+    NUTRITIONIX_APP_ID = os.environ.get('NUTRITIONIX_APP_ID', '630dceac')
+    NUTRITIONIX_APP_KEY = os.environ.get('NUTRITIONIX_APP_KEY', '8e923dd3df9048bc4c9da8e92928d4bb')
+    NUTRITIONIX_TIMEOUT = 5
+    # answers are cached for all workers, calls per minute across workers (None = no limit)
+    NUTRITIONIX_CACHE_TTL = 86400
+    NUTRITIONIX_RATE_LIMIT = None
+
+    # local nutrition table matches below this confidence (0 - 1) go to Nutritionix
+    NUTRITION_MIN_CONFIDENCE = 0.6
+    # weakest local match still used when Nutritionix cannot be reached
+    NUTRITION_FALLBACK_CONFIDENCE = 0.3
+
+    # retries when SQLite reports "database is locked" on commit
+    SQLITE_LOCK_RETRIES = 3
+    SQLITE_LOCK_BACKOFF = 0.05
+
+    # batch concurrent inserts/updates into one transaction per database file:
+    # committed every GROUP_COMMIT_WINDOW seconds or GROUP_COMMIT_MAX_ROWS writes
+    GROUP_COMMIT = os.environ.get('GROUP_COMMIT', '0') == '1'
+    GROUP_COMMIT_WINDOW = 0.002
+    GROUP_COMMIT_MAX_ROWS = 100
+
+    # request/database/provider metrics exposed on /metrics
+    METRICS_ENABLED = True
+
+    # request profiling: admins can send "X-Profile: 1", a fraction of all
+    # requests can be sampled; traces are kept in instance/<PROFILE_DIR>
+    PROFILE_HEADER = 'X-Profile'
+    PROFILE_SAMPLE_RATE = 0.0
+    PROFILE_DIR = 'profiles'
+    PROFILE_MAX_FILES = 200
+
+    # cross-worker cache and counters, relative to the instance folder or absolute;
+    # servers on another database (e.g. "flask loadtest") should use their own
+    SHARED_STATE_FILE = os.environ.get('SHARED_STATE_FILE', 'shared_state.db')
+
+    # food id <-> text cache of each process (foods.py), in foods
+    FOOD_CACHE_SIZE = 10000
+
+    # "flask archive run" moves entries older than this into the archive tables
+    ARCHIVE_AFTER_DAYS = 180
+
+    # per-user entry shards, laid out by "flask shards reshard <N>"; relative to the
+    # instance folder or absolute, servers on another database need their own
+    SHARD_DIR = os.environ.get('SHARD_DIR', 'shards')
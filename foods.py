@@ -0,0 +1,161 @@
+'''
+    Food dictionary
+    Entries store a food_id into the foods table (main database) instead of
+    repeating their text. Each exact text is one food, so entries always return
+    the text they were saved with; foods also store a key (lowercase, single
+    spaces) that groups "Coffee" and "coffee " for per-food aggregates.
+    Foods never change or get deleted, so every process keeps an id <-> text
+    cache that stays valid after fork; it is filled on demand and keeps the
+    FOOD_CACHE_SIZE most recently used foods.
+
+    Reads go through db.session without autoflush: a pending change of the
+    request's entry would otherwise take the SQLite write lock that
+    remember_calories (own connection) then waits on.
+
+    Calories resolved for a food are stored on its row, so the same text is
+    only resolved once (nutrition.py), whatever the number of entries.
+'''
+import threading
+from collections import OrderedDict
+from sqlalchemy.dialects.sqlite import insert
+import nutrition
+from models import db
+from models.food import Food
+
+_texts = OrderedDict()
+_ids = {}
+_lock = threading.Lock()
+_size = 10000
+
+
+def configure(size):
+    global _size
+    _size = size
+
+
+def food_key(text):
+    '''what texts are grouped by (foods.key)'''
+    return ' '.join(text.lower().split())
+
+
+def remember(rows):
+    '''add (id, text) pairs to the cache, dropping the least recently used foods'''
+    with _lock:
+        for food_id, text in rows:
+            _texts[food_id] = text
+            _texts.move_to_end(food_id)
+            _ids[text] = food_id
+        while len(_texts) > _size:
+            _, text = _texts.popitem(last=False)
+            _ids.pop(text, None)
+
+
+def clear():
+    with _lock:
+        _texts.clear()
+        _ids.clear()
+
+
+def cached_text(food_id):
+    with _lock:
+        text = _texts.get(food_id)
+        if text is not None:
+            _texts.move_to_end(food_id)
+        return text
+
+
+def cached_id(text):
+    with _lock:
+        food_id = _ids.get(text)
+        if food_id is not None:
+            _texts.move_to_end(food_id)
+        return food_id
+
+
+def cached(food_ids):
+    '''({food_id: text} of the cached ids, the ids that are not cached)'''
+    texts, missing = {}, set()
+    for food_id in food_ids:
+        if food_id is None:
+            continue
+        text = cached_text(food_id)
+        if text is None:
+            missing.add(food_id)
+        else:
+            texts[food_id] = text
+    return texts, missing
+
+
+def intern_statement(text):
+    return insert(Food).values(text=text, key=food_key(text)).on_conflict_do_nothing(index_elements=['text'])
+
+
+def id_statement(text):
+    return db.select(Food.id).where(Food.text == text)
+
+
+def texts_statement(food_ids):
+    return db.select(Food.id, Food.text).where(Food.id.in_(food_ids))
+
+
+def load(food_ids):
+    '''
+        {food_id: text} of the given ids, the ones not cached are loaded with one query;
+        callers use the result, a page of more foods than the cache holds evicts its own
+    '''
+    texts, missing = cached(food_ids)
+    if missing:
+        with db.session.no_autoflush:
+            rows = db.session.execute(texts_statement(missing)).all()
+        remember(rows)
+        texts.update(rows)
+    return texts
+
+
+def text_of(food_id):
+    if food_id is None:
+        return None
+    text = cached_text(food_id)
+    if text is None:
+        text = load([food_id])[food_id]
+    return text
+
+
+def intern(text):
+    '''id of a text, added to the dictionary in its own transaction when new'''
+    if text is None:
+        return None
+    food_id = cached_id(text)
+    if food_id is None:
+        with db.engine.begin() as connection:
+            connection.execute(intern_statement(text))
+            food_id = connection.execute(id_statement(text)).scalar()
+        remember([(food_id, text)])
+    return food_id
+
+
+def matching_statement(pattern):
+    '''ids of the foods whose text contains pattern, for the food filter of the entry lists'''
+    return db.select(Food.id).where(Food.text.ilike(f'%{pattern}%'))
+
+
+def calories_of(food_id):
+    '''calories of a food, resolved (and stored) on first use'''
+    if food_id is None:
+        return None
+    with db.session.no_autoflush:
+        calories = db.session.execute(db.select(Food.calories).where(Food.id == food_id)).scalar()
+    if calories is None:
+        calories, final = nutrition.resolve_calories(text_of(food_id))
+        if final and calories is not None:
+            remember_calories(food_id, calories)
+    return calories
+
+
+def remember_calories(food_id, calories):
+    with db.engine.begin() as connection:
+        connection.execute(db.update(Food).where(Food.id == food_id).values(calories=calories))
+
+
+def init_app(app):
+    configure(app.config.get('FOOD_CACHE_SIZE', _size))
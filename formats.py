@@ -0,0 +1,53 @@
+'''
+    Response formats of the list endpoints (GET /entries, GET /users/list)
+    The shape is picked with ?format=:
+    - json (default): an array of objects, one per row
+    - columnar: one array per field, {"id": [...], "date": [...], ...}, so
+      every key name is written once per page instead of once per row
+    The encoding is negotiated with the Accept header: application/json
+    (default) or MessagePack (application/msgpack or application/x-msgpack).
+    Both combine, analytics clients pulling big pages get the smallest
+    payload with ?format=columnar and Accept: application/msgpack.
+'''
+import msgpack
+from flask import current_app, jsonify
+
+SHAPES = ('json', 'columnar')
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+'''offered in order of preference when the client accepts several (or */*)'''
+MIMETYPES = [JSON, MSGPACK, 'application/x-msgpack']
+
+
+def shape(args):
+    '''requested shape, None when ?format= is not one of SHAPES'''
+    value = args.get('format', 'json')
+    return value if value in SHAPES else None
+
+
+def columnar(args):
+    return shape(args) == 'columnar'
+
+
+def mimetype(accept_mimetypes):
+    '''the one of MIMETYPES the client prefers, JSON when it accepts none of them'''
+    return accept_mimetypes.best_match(MIMETYPES, default=JSON)
+
+
+def pack(payload):
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def invalid_format_message():
+    return {'message': f'Invalid format, use one of: {", ".join(SHAPES)}'}
+
+
+def response(payload, request):
+    '''Flask response of a list payload in the encoding the request asks for'''
+    encoding = mimetype(request.accept_mimetypes)
+    if encoding != JSON:
+        result = current_app.response_class(pack(payload), mimetype=encoding)
+    else:
+        result = jsonify(payload)
+    result.vary.add('Accept')
+    return result
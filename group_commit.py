@@ -0,0 +1,203 @@
+'''
+    Group commit of model inserts and updates (opt-in, GROUP_COMMIT = True)
+    Every save used to be its own transaction, so N concurrent requests meant
+    N lock acquisitions and N fsyncs on the SQLite file. In group commit mode
+    the statement of a save is handed to one writer thread per database file,
+    which runs everything queued within GROUP_COMMIT_WINDOW seconds (at most
+    GROUP_COMMIT_MAX_ROWS statements) in a single transaction.
+
+    Each statement runs inside its own savepoint: a failing statement (e.g. an
+    IntegrityError) is rolled back alone and raised to its caller only. An
+    UPDATE whose row is gone raises StaleDataError, as a session flush does.
+    Callers block until the transaction holding their write is committed, so a
+    save that returned is exactly as durable as before.
+'''
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import sqlalchemy as sa
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import make_transient, make_transient_to_detached
+from sqlalchemy.orm.exc import StaleDataError
+import metrics
+
+_writers = {}
+_writers_pid = None
+_writers_lock = threading.Lock()
+
+
+class _Job:
+    __slots__ = ('statement', 'future')
+
+    def __init__(self, statement):
+        self.statement = statement
+        self.future = Future()
+
+
+class Writer:
+    '''single thread committing the queued statements of one database'''
+    def __init__(self, url, window, max_rows, retries, backoff):
+        self.engine = sa.create_engine(url)
+        # let SQLAlchemy emit BEGIN itself, pysqlite would otherwise break SAVEPOINT
+        event.listen(self.engine, 'connect', _disable_pysqlite_transactions)
+        event.listen(self.engine, 'begin', _begin_immediate)
+        self.window = window
+        self.max_rows = max_rows
+        self.retries = retries
+        self.backoff = backoff
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name=f'group-commit {url.database}', daemon=True)
+        self.thread.start()
+
+    def submit(self, statement):
+        job = _Job(statement)
+        self.queue.put(job)
+        return job.future
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_rows:
+            try:
+                batch.append(self.queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            metrics.GROUP_COMMIT_BATCH_SIZE.observe(len(batch))
+            try:
+                results = self._commit(batch)
+            except Exception as error:
+                for job in batch:
+                    job.future.set_exception(error)
+                continue
+            for job, (row, error) in zip(batch, results):
+                if error is not None:
+                    job.future.set_exception(error)
+                else:
+                    job.future.set_result(row)
+
+    def _commit(self, batch):
+        '''one transaction for the batch, retried as a whole while the file is locked'''
+        for attempt in range(self.retries + 1):
+            try:
+                return self._execute(batch)
+            except OperationalError as error:
+                if 'database is locked' not in str(error.orig) or attempt == self.retries:
+                    raise
+                metrics.DB_LOCK_RETRIES.labels('group_commit').inc()
+                time.sleep(self.backoff * (2 ** attempt))
+
+    def _execute(self, batch):
+        results = []
+        with self.engine.connect() as connection, connection.begin():
+            for job in batch:
+                savepoint = connection.begin_nested()
+                try:
+                    result = connection.execute(job.statement)
+                    row = result.first() if result.returns_rows else None
+                    if job.statement.is_update and result.rowcount != 1:
+                        # the row is gone (or was never there), as the ORM flush reports it
+                        raise StaleDataError(
+                            f"UPDATE statement on table '{job.statement.table.name}' expected to "
+                            f"update 1 row(s); {result.rowcount} were matched."
+                        )
+                except StaleDataError as error:
+                    savepoint.rollback()
+                    results.append((None, error))
+                except OperationalError as error:
+                    if 'database is locked' in str(error.orig):
+                        raise
+                    savepoint.rollback()
+                    results.append((None, error))
+                except sa.exc.SQLAlchemyError as error:
+                    savepoint.rollback()
+                    results.append((None, error))
+                else:
+                    savepoint.commit()
+                    results.append((row, None))
+        return results
+
+
+def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+
+
+def _begin_immediate(connection):
+    '''take the write lock up front instead of failing halfway through a batch'''
+    connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def writer_for(engine):
+    '''writer of a database, threads do not survive fork so they are created per process'''
+    global _writers_pid
+    key = engine.url.render_as_string(hide_password=False)
+    with _writers_lock:
+        if _writers_pid != os.getpid():
+            _writers.clear()
+            _writers_pid = os.getpid()
+        writer = _writers.get(key)
+        if writer is None:
+            config = current_app.config
+            writer = _writers[key] = Writer(
+                engine.url,
+                config.get('GROUP_COMMIT_WINDOW', 0.002),
+                config.get('GROUP_COMMIT_MAX_ROWS', 100),
+                config.get('SQLITE_LOCK_RETRIES', 3),
+                config.get('SQLITE_LOCK_BACKOFF', 0.05)
+            )
+        return writer
+
+
+def _statement(instance, state):
+    '''INSERT for a new instance, UPDATE of the changed columns otherwise (None if nothing changed)'''
+    mapper = state.mapper
+    table = mapper.local_table
+    if state.key is None:
+        values = {}
+        for attr in mapper.column_attrs:
+            column = attr.columns[0]
+            value = getattr(instance, attr.key)
+            # like the ORM, None leaves the id and column defaults to the database
+            if value is None and (column.primary_key or column.default is not None or column.server_default is not None):
+                continue
+            values[column] = value
+        return table.insert().values(values).returning(*table.c)
+
+    changed = {attr.columns[0]: getattr(instance, attr.key) for attr in mapper.column_attrs
+               if state.attrs[attr.key].history.has_changes()}
+    if not changed:
+        return None
+    condition = sa.and_(*[column == value for column, value in zip(mapper.primary_key, state.identity)])
+    return table.update().where(condition).values(changed)
+
+
+def save(instance, session):
+    '''
+        write an instance through the writer of its database and wait for the commit;
+        afterwards the instance is persistent and clean in session, as after session.commit()
+    '''
+    state = inspect(instance)
+    statement = _statement(instance, state)
+    if statement is None:
+        return
+    engine = session.get_bind(mapper=state.mapper)
+
+    # out of the request session until committed, so autoflush cannot write it a second time
+    if state.session_id is not None:
+        session.expunge(instance)
+    make_transient(instance)
+
+    row = writer_for(engine).submit(statement).result()
+    if row is not None:
+        for attr in state.mapper.column_attrs:
+            setattr(instance, attr.key, row._mapping[attr.columns[0]])
+    make_transient_to_detached(instance)
+    session.add(instance)
@@ -0,0 +1,59 @@
+'''
+    Multi-worker deployment
+    > gunicorn -c gunicorn.conf.py app:app
+
+    The application is imported once in the master (preload_app) and the
+    workers are forked from it, so code is loaded only once and shared
+    copy-on-write. Nothing may keep a database connection across the fork:
+    every worker disposes the inherited engine pool and opens its own
+    connections, then warms its caches before taking traffic.
+
+    Cross-worker state lives outside the processes: the Nutritionix cache and
+    call counters in shared_state (SQLite), Prometheus samples in
+    PROMETHEUS_MULTIPROC_DIR.
+'''
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+preload_app = True
+
+# must be set before the app (and prometheus_client) is imported by the master
+if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = os.path.join(tempfile.gettempdir(), 'calories-api-metrics')
+
+
+def on_starting(server):
+    '''samples of a previous run would otherwise be merged into this one'''
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def when_ready(server):
+    import shared_state
+    shared_state.purge_expired()
+
+
+def post_fork(server, worker):
+    from app import app
+    from models import db
+    import nutrition
+    import shared_state
+    import sharding
+
+    with app.app_context():
+        # connections inherited from the master belong to it, do not close them from here
+        db.engine.dispose(close=False)
+        sharding.dispose_engines(app)
+        shared_state.init_app(app)
+        nutrition.reload_index()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
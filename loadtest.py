@@ -0,0 +1,235 @@
+'''
+    Concurrent HTTP load test
+    Seeds users through the API, logs them in and drives a weighted mix of
+    /login, POST /entries, GET /entries and /users/list from concurrent
+    clients, then reports throughput, p50/p95/p99 latency and errors per endpoint.
+
+    flask loadtest                              spawn a server on a temporary database
+    flask loadtest --url http://localhost:5000  target an already running server
+
+    When the server is spawned, the Nutritionix API is replaced by a local stub
+    so results measure this service and not the provider.
+'''
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import click
+import requests
+from sqlalchemy import create_engine
+from models import db
+
+DEFAULT_MIX = 'login=1,create_entry=3,list_entries=5,list_users=1'
+FOODS = ['coffee', '2 eggs', '4 bowls chicken', 'banana', 'tea', 'rice and dal', 'apple pie']
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _start_provider_stub(latency):
+    '''local stand-in for Nutritionix answering every query with a random amount'''
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(latency)
+            body = json.dumps({'foods': [{'nf_calories': random.randint(50, 600)}]}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _spawn_server(workdir, provider_url):
+    '''run "flask run" on a fresh database, returns (process, base url)'''
+    database_url = 'sqlite:///' + os.path.join(workdir, 'loadtest.db')
+    db.metadata.create_all(create_engine(database_url))
+
+    port = _free_port()
+    # the stub's calories must not end up in the Nutritionix cache of the real instance,
+    # nor the load test entries in its shard files
+    env = dict(
+        os.environ, DATABASE_URL=database_url, NUTRITIONIX_API_URL=provider_url, FLASK_APP='app',
+        SHARED_STATE_FILE=os.path.join(workdir, 'shared_state.db'), SHARD_DIR=os.path.join(workdir, 'shards')
+    )
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'flask', 'run', '--port', str(port), '--no-reload', '--no-debugger'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            requests.get(base_url + '/metrics', timeout=1)
+            return process, base_url
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    process.terminate()
+    raise click.ClickException('Server did not start within 15s')
+
+
+def _parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        if name not in OPERATIONS:
+            raise click.BadParameter(f'unknown operation {name!r}, expected one of {", ".join(OPERATIONS)}', param_hint='--mix')
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def _seed(base_url, users):
+    '''register an admin and regular users, returns (admin token, [(credentials, token)])'''
+    run_id = f'{int(time.time())}{random.randint(0, 9999)}'
+    accounts = [{'name': f'lt-admin-{run_id}', 'email': f'lt-admin-{run_id}@loadtest.local', 'password': 'loadtest', 'role': 'admin'}]
+    accounts += [
+        {'name': f'lt-user{i}-{run_id}', 'email': f'lt-user{i}-{run_id}@loadtest.local', 'password': 'loadtest', 'role': 'regular'}
+        for i in range(users)
+    ]
+
+    tokens = []
+    for account in accounts:
+        response = requests.post(base_url + '/register', json=account)
+        if response.status_code != 201:
+            raise click.ClickException(f'Seeding {account["email"]} failed: {response.status_code} {response.text}')
+        login = requests.post(base_url + '/login', json={'email': account['email'], 'password': account['password']})
+        tokens.append((account, login.json()['access_token']))
+    return tokens[0][1], tokens[1:]
+
+
+def _login(session, base_url, account, token, admin_token):
+    return session.post(base_url + '/login', json={'email': account['email'], 'password': account['password']})
+
+
+def _create_entry(session, base_url, account, token, admin_token):
+    return session.post(base_url + '/entries', json={'text': random.choice(FOODS)}, headers={'Authorization': token})
+
+
+def _list_entries(session, base_url, account, token, admin_token):
+    params = {'page': 1, 'per_page': 20}
+    if random.random() < 0.3:
+        params['food'] = random.choice(FOODS).split()[-1]
+    return session.get(base_url + '/entries', params=params, headers={'Authorization': token})
+
+
+def _list_users(session, base_url, account, token, admin_token):
+    return session.get(base_url + '/users/list', params={'page': 1, 'per_page': 20}, headers={'Authorization': admin_token})
+
+
+OPERATIONS = {
+    'login': _login,
+    'create_entry': _create_entry,
+    'list_entries': _list_entries,
+    'list_users': _list_users,
+}
+
+
+def _client(base_url, accounts, admin_token, weights, deadline, results, lock):
+    session = requests.Session()
+    names = list(weights)
+    relative = list(weights.values())
+    samples = []
+    while time.monotonic() < deadline:
+        name = random.choices(names, weights=relative)[0]
+        account, token = random.choice(accounts)
+        start = time.perf_counter()
+        try:
+            response = OPERATIONS[name](session, base_url, account, token, admin_token)
+            outcome = response.status_code
+        except requests.exceptions.RequestException as error:
+            outcome = type(error).__name__
+        samples.append((name, time.perf_counter() - start, outcome))
+    with lock:
+        results.extend(samples)
+
+
+def _percentile(ordered, fraction):
+    '''nearest-rank percentile of an already sorted list'''
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _report(results, elapsed):
+    by_operation = defaultdict(list)
+    for name, latency, outcome in results:
+        by_operation[name].append((latency, outcome))
+    by_operation['TOTAL'] = [(latency, outcome) for _, latency, outcome in results]
+
+    click.echo(f'\n{"endpoint":<14}{"requests":>10}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"errors":>8}')
+    for name, samples in by_operation.items():
+        latencies = sorted(latency * 1000 for latency, _ in samples)
+        errors = defaultdict(int)
+        for _, outcome in samples:
+            if not isinstance(outcome, int) or outcome >= 400:
+                errors[outcome] += 1
+        click.echo(
+            f'{name:<14}{len(samples):>10}{len(samples) / elapsed:>10.1f}'
+            f'{_percentile(latencies, .50):>10.1f}{_percentile(latencies, .95):>10.1f}{_percentile(latencies, .99):>10.1f}'
+            f'{sum(errors.values()):>8}'
+        )
+        for outcome, count in sorted(errors.items(), key=lambda item: -item[1]):
+            click.echo(f'{"":<14}  {outcome}: {count}')
+
+
+@click.command('loadtest')
+@click.option('--url', default=None, help='Base url of a running server. Without it a server is spawned on a temporary database.')
+@click.option('--duration', default=30.0, show_default=True, help='Seconds to generate load for.')
+@click.option('--concurrency', default=16, show_default=True, help='Number of concurrent clients.')
+@click.option('--users', default=20, show_default=True, help='Regular users to seed.')
+@click.option('--mix', default=DEFAULT_MIX, show_default=True, help='Weighted operation mix.')
+@click.option('--provider-latency', default=0.0, show_default=True, help='Seconds the stubbed calorie provider waits per lookup.')
+def loadtest_command(url, duration, concurrency, users, mix, provider_latency):
+    '''Drive concurrent API traffic and report latency percentiles.'''
+    weights = _parse_mix(mix)
+    process = provider = None
+    workdir = tempfile.TemporaryDirectory(prefix='loadtest-')
+    try:
+        if url is None:
+            provider = _start_provider_stub(provider_latency)
+            process, url = _spawn_server(workdir.name, f'http://127.0.0.1:{provider.server_port}/v2/natural/nutrients')
+            click.echo(f'Spawned server at {url} with a stubbed calorie provider')
+        url = url.rstrip('/')
+
+        admin_token, accounts = _seed(url, users)
+        click.echo(f'Seeded {len(accounts)} users, running {concurrency} clients for {duration:.0f}s')
+
+        results, lock = [], threading.Lock()
+        deadline = time.monotonic() + duration
+        start = time.monotonic()
+        clients = [
+            threading.Thread(target=_client, args=(url, accounts, admin_token, weights, deadline, results, lock))
+            for _ in range(concurrency)
+        ]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        _report(results, time.monotonic() - start)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        if provider is not None:
+            provider.shutdown()
+        workdir.cleanup()
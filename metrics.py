@@ -0,0 +1,138 @@
+'''
+    Prometheus metrics for the API
+    request latency and status codes per route, database statement duration,
+    calorie provider latency/outcomes, SQLite lock retries and group commit
+    batch sizes.
+
+    When PROMETHEUS_MULTIPROC_DIR is set (before this module is imported) every
+    worker process writes its samples to that directory and /metrics merges them,
+    so the numbers are correct under a multi-worker server.
+'''
+import os
+import time
+from flask import g, request
+from prometheus_client import (CollectorRegistry, Counter, Histogram, REGISTRY,
+                               CONTENT_TYPE_LATEST, generate_latest, multiprocess)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'Time spent handling a request',
+    ['blueprint', 'route', 'method']
+)
+REQUEST_COUNT = Counter(
+    'http_requests_total',
+    'Requests handled, by response status code',
+    ['blueprint', 'route', 'method', 'status']
+)
+DB_STATEMENT_LATENCY = Histogram(
+    'db_statement_duration_seconds',
+    'Time spent executing a database statement',
+    ['statement'],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+)
+PROVIDER_LATENCY = Histogram(
+    'calorie_provider_request_duration_seconds',
+    'Time spent waiting on the calorie provider',
+    ['provider']
+)
+PROVIDER_REQUESTS = Counter(
+    'calorie_provider_requests_total',
+    'Calorie provider lookups, by outcome',
+    ['provider', 'outcome']
+)
+DB_LOCK_RETRIES = Counter(
+    'db_lock_retries_total',
+    'Commits retried because SQLite reported "database is locked"',
+    ['operation']
+)
+GROUP_COMMIT_BATCH_SIZE = Histogram(
+    'db_group_commit_batch_size',
+    'Statements committed together by the group commit writer',
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250)
+)
+
+
+def observe_request(blueprint, rule, method, status, duration):
+    '''record one handled request'''
+    REQUEST_LATENCY.labels(blueprint, rule, method).observe(duration)
+    REQUEST_COUNT.labels(blueprint, rule, method, status).inc()
+
+
+def observe_provider(provider, outcome, duration):
+    '''record one outbound calorie provider call'''
+    PROVIDER_LATENCY.labels(provider).observe(duration)
+    PROVIDER_REQUESTS.labels(provider, outcome).inc()
+
+
+def render():
+    '''metrics in the Prometheus text format, merged across workers if needed'''
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def route_labels(request):
+    '''
+        label by url rule (not path) so /entries/1 and /entries/2 share a series;
+        unmatched urls are folded into one series to keep cardinality bounded
+    '''
+    rule = request.url_rule.rule if request.url_rule else 'unmatched'
+    return request.blueprint or '', rule, request.method
+
+
+def _start_timer():
+    g._metrics_start = time.perf_counter()
+
+
+def _record_request(response):
+    start = g.pop('_metrics_start', None)
+    if start is not None:
+        observe_request(*route_labels(request), response.status_code, time.perf_counter() - start)
+    return response
+
+
+def _record_failed_request(exception):
+    '''after_request is skipped when an exception propagates (debug mode), count those as 500'''
+    start = g.pop('_metrics_start', None)
+    if start is not None and exception is not None:
+        observe_request(*route_labels(request), 500, time.perf_counter() - start)
+
+
+_STATEMENT_VERBS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_metrics_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info['_metrics_start'].pop()
+    verb = statement.lstrip()[:6].upper()
+    if verb not in _STATEMENT_VERBS:
+        verb = 'OTHER'
+    DB_STATEMENT_LATENCY.labels(verb).observe(time.perf_counter() - start)
+
+
+def _handle_error(exception_context):
+    starts = exception_context.connection.info.get('_metrics_start') if exception_context.connection else None
+    if starts:
+        starts.pop()
+
+
+def init_app(app):
+    '''register request hooks and database statement timing'''
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.teardown_request(_record_failed_request)
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
@@ -0,0 +1,41 @@
+"""Add food keys
+
+Revision ID: 3f8a61c0d2b9
+Revises: 9d2c4b7e1a35
+Create Date: 2026-10-19 20:11:37.502114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8a61c0d2b9'
+down_revision = '9d2c4b7e1a35'
+branch_labels = None
+depends_on = None
+
+
+def _food_key(text):
+    '''foods.food_key at the time of this revision'''
+    return ' '.join(text.lower().split())
+
+
+def upgrade():
+    with op.batch_alter_table('foods', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('key', sa.String(length=255), nullable=True))
+
+    # every food keeps its text and its entries, the key only groups them
+    connection = op.get_bind()
+    for food_id, text in connection.execute(sa.text('SELECT id, text FROM foods')).all():
+        connection.execute(sa.text('UPDATE foods SET key = :key WHERE id = :id'), {'key': _food_key(text), 'id': food_id})
+
+    with op.batch_alter_table('foods', schema=None) as batch_op:
+        batch_op.alter_column('key', existing_type=sa.String(length=255), nullable=False)
+        batch_op.create_index(batch_op.f('ix_foods_key'), ['key'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('foods', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_foods_key'))
+        batch_op.drop_column('key')
@@ -0,0 +1,52 @@
+"""Add entry archive
+
+Revision ID: 5b9e0f7c2d13
+Revises: c3d58e2a91f4
+Create Date: 2026-10-19 14:20:53.601482
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b9e0f7c2d13'
+down_revision = 'c3d58e2a91f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('archived_entries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('time', sa.Time(), nullable=False),
+    sa.Column('text', sa.String(length=255), nullable=False),
+    sa.Column('calories', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_archived_entries_user_id_date', 'archived_entries', ['user_id', 'date'], unique=False)
+    op.create_table('archived_daily_totals',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('calories', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'date')
+    )
+    op.create_index('ix_archived_daily_totals_date', 'archived_daily_totals', ['date'], unique=False)
+    op.execute(
+        "CREATE TRIGGER archived_entries_change_on_delete AFTER DELETE ON archived_entries BEGIN "
+        "DELETE FROM entry_changes WHERE entry_id = OLD.id; "
+        "INSERT INTO entry_changes (entry_id, user_id, op) VALUES (OLD.id, OLD.user_id, 'delete'); "
+        "END"
+    )
+
+
+def downgrade():
+    op.execute('DROP TRIGGER IF EXISTS archived_entries_change_on_delete')
+    op.drop_index('ix_archived_daily_totals_date', table_name='archived_daily_totals')
+    op.drop_table('archived_daily_totals')
+    op.drop_index('ix_archived_entries_user_id_date', table_name='archived_entries')
+    op.drop_table('archived_entries')
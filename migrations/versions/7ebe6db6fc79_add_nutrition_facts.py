@@ -0,0 +1,33 @@
+"""Add local nutrition table
+
+Revision ID: 7ebe6db6fc79
+Revises: a94131e7d3e2
+Create Date: 2026-10-19 10:12:41.503122
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7ebe6db6fc79'
+down_revision = 'a94131e7d3e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('nutrition_facts',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('calories', sa.Float(), nullable=False),
+    sa.Column('unit', sa.String(length=50), nullable=False),
+    sa.Column('quantity', sa.Float(), nullable=False),
+    sa.Column('grams', sa.Float(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('nutrition_facts')
@@ -0,0 +1,64 @@
+"""Never reuse entry ids
+
+Revision ID: 9d2c4b7e1a35
+Revises: e41f7a9b6c08
+Create Date: 2026-10-19 18:42:05.118320
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+import sharding
+
+
+# revision identifiers, used by Alembic.
+revision = '9d2c4b7e1a35'
+down_revision = 'e41f7a9b6c08'
+branch_labels = None
+depends_on = None
+
+# rebuilding entries in batch mode drops its triggers
+TRIGGERS = {
+    'entries_change_on_insert': ('INSERT', 'NEW', 'upsert'),
+    'entries_change_on_update': ('UPDATE', 'NEW', 'upsert'),
+    'entries_change_on_delete': ('DELETE', 'OLD', 'delete'),
+}
+
+
+def _refuse_sharded():
+    if sharding.read_shard_count(sharding.shard_directory(current_app)):
+        raise RuntimeError('Entries are sharded, run "flask shards reshard 0" before upgrading')
+
+
+def _create_triggers():
+    for name, (event, row, change) in TRIGGERS.items():
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+        op.execute(
+            f"CREATE TRIGGER {name} AFTER {event} ON entries BEGIN "
+            f"DELETE FROM entry_changes WHERE entry_id = {row}.id; "
+            f"INSERT INTO entry_changes (entry_id, user_id, op) VALUES ({row}.id, {row}.user_id, '{change}'); "
+            f"END"
+        )
+
+
+def upgrade():
+    _refuse_sharded()
+    with op.batch_alter_table('entries', schema=None, recreate='always',
+                              table_kwargs={'sqlite_autoincrement': True}):
+        pass
+    _create_triggers()
+    # the sequence starts above every id in use, archived ones included
+    op.execute("DELETE FROM sqlite_sequence WHERE name = 'entries'")
+    op.execute(
+        "INSERT INTO sqlite_sequence (name, seq) SELECT 'entries', max(id) FROM "
+        "(SELECT id FROM entries UNION ALL SELECT id FROM archived_entries) HAVING max(id) IS NOT NULL"
+    )
+
+
+def downgrade():
+    _refuse_sharded()
+    with op.batch_alter_table('entries', schema=None, recreate='always',
+                              table_kwargs={'sqlite_autoincrement': False}):
+        pass
+    _create_triggers()
+    op.execute("DELETE FROM sqlite_sequence WHERE name = 'entries'")
@@ -0,0 +1,56 @@
+"""Add entry change feed
+
+Revision ID: c3d58e2a91f4
+Revises: 7ebe6db6fc79
+Create Date: 2026-10-19 13:02:17.284519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d58e2a91f4'
+down_revision = '7ebe6db6fc79'
+branch_labels = None
+depends_on = None
+
+TRIGGERS = {
+    'entries_change_on_insert': ('INSERT', 'NEW', 'upsert'),
+    'entries_change_on_update': ('UPDATE', 'NEW', 'upsert'),
+    'entries_change_on_delete': ('DELETE', 'OLD', 'delete'),
+}
+
+
+def upgrade():
+    op.create_table('entry_changes',
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.Column('entry_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('op', sa.String(length=10), nullable=False),
+    sa.PrimaryKeyConstraint('seq'),
+    sqlite_autoincrement=True
+    )
+    op.create_index('ix_entry_changes_entry_id', 'entry_changes', ['entry_id'], unique=False)
+    op.create_index('ix_entry_changes_user_id_seq', 'entry_changes', ['user_id', 'seq'], unique=False)
+
+    # existing entries start out as one upsert each, so since=0 returns all of them
+    op.execute(
+        "INSERT INTO entry_changes (entry_id, user_id, op) "
+        "SELECT id, user_id, 'upsert' FROM entries ORDER BY id"
+    )
+    for name, (event, row, change) in TRIGGERS.items():
+        op.execute(
+            f"CREATE TRIGGER {name} AFTER {event} ON entries BEGIN "
+            f"DELETE FROM entry_changes WHERE entry_id = {row}.id; "
+            f"INSERT INTO entry_changes (entry_id, user_id, op) VALUES ({row}.id, {row}.user_id, '{change}'); "
+            f"END"
+        )
+
+
+def downgrade():
+    for trigger in TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    op.drop_index('ix_entry_changes_user_id_seq', table_name='entry_changes')
+    op.drop_index('ix_entry_changes_entry_id', table_name='entry_changes')
+    op.drop_table('entry_changes')
@@ -0,0 +1,87 @@
+"""Add foods dictionary
+
+Revision ID: e41f7a9b6c08
+Revises: 5b9e0f7c2d13
+Create Date: 2026-10-19 16:05:12.410973
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+import sharding
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41f7a9b6c08'
+down_revision = '5b9e0f7c2d13'
+branch_labels = None
+depends_on = None
+
+ENTRY_TABLES = ['entries', 'archived_entries']
+
+# rebuilding a table in batch mode drops its triggers
+TRIGGERS = {
+    'entries_change_on_insert': ('INSERT', 'entries', 'NEW', 'upsert'),
+    'entries_change_on_update': ('UPDATE', 'entries', 'NEW', 'upsert'),
+    'entries_change_on_delete': ('DELETE', 'entries', 'OLD', 'delete'),
+    'archived_entries_change_on_delete': ('DELETE', 'archived_entries', 'OLD', 'delete'),
+}
+
+
+def _refuse_sharded():
+    if sharding.read_shard_count(sharding.shard_directory(current_app)):
+        raise RuntimeError('Entries are sharded, run "flask shards reshard 0" before upgrading')
+
+
+def _create_triggers():
+    for name, (event, table, row, change) in TRIGGERS.items():
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+        op.execute(
+            f"CREATE TRIGGER {name} AFTER {event} ON {table} BEGIN "
+            f"DELETE FROM entry_changes WHERE entry_id = {row}.id; "
+            f"INSERT INTO entry_changes (entry_id, user_id, op) VALUES ({row}.id, {row}.user_id, '{change}'); "
+            f"END"
+        )
+
+
+def upgrade():
+    _refuse_sharded()
+    op.create_table('foods',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('text', sa.String(length=255), nullable=False),
+    sa.Column('calories', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('text')
+    )
+    op.execute(
+        "INSERT INTO foods (text) SELECT text FROM entries "
+        "UNION SELECT text FROM archived_entries ORDER BY 1"
+    )
+
+    for table in ENTRY_TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('food_id', sa.Integer(), nullable=True))
+        op.execute(f"UPDATE {table} SET food_id = (SELECT id FROM foods WHERE foods.text = {table}.text)")
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column('food_id', existing_type=sa.Integer(), nullable=False)
+            batch_op.create_foreign_key(f'fk_{table}_food_id_foods', 'foods', ['food_id'], ['id'])
+            batch_op.drop_column('text')
+    with op.batch_alter_table('entries', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_entries_food_id'), ['food_id'], unique=False)
+    _create_triggers()
+
+
+def downgrade():
+    _refuse_sharded()
+    with op.batch_alter_table('entries', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_entries_food_id'))
+    for table in ENTRY_TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('text', sa.String(length=255), nullable=True))
+        op.execute(f"UPDATE {table} SET text = (SELECT text FROM foods WHERE foods.id = {table}.food_id)")
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column('text', existing_type=sa.String(length=255), nullable=False)
+            batch_op.drop_constraint(f'fk_{table}_food_id_foods', type_='foreignkey')
+            batch_op.drop_column('food_id')
+    _create_triggers()
+    op.drop_table('foods')
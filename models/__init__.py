@@ -1,6 +1,56 @@
+import time
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect
+from sqlalchemy.exc import OperationalError
+import group_commit
+import metrics
 
 db = SQLAlchemy()
 
+'''
+    add (or delete) an instance and commit (on db.session unless the
+    entry shard session is given), retrying with backoff when SQLite
+    reports that another connection holds the write lock.
+    A rollback expires the instance, so its column values are captured first
+    and re-applied on every attempt.
+    With GROUP_COMMIT enabled inserts and updates go through the group commit
+    writer instead, which retries on its own.
+'''
+def commit_with_retry(instance, operation, delete=False, session=None):
+    session = session or db.session
+    if not delete and current_app.config.get('GROUP_COMMIT'):
+        group_commit.save(instance, session)
+        return
+    retries = current_app.config.get('SQLITE_LOCK_RETRIES', 3)
+    backoff = current_app.config.get('SQLITE_LOCK_BACKOFF', 0.05)
+    values = {}
+    if not delete:
+        mapper = inspect(instance).mapper
+        values = {attr.key: getattr(instance, attr.key) for attr in mapper.column_attrs
+                  if not any(column.primary_key for column in attr.columns)}
+
+    for attempt in range(retries + 1):
+        try:
+            if delete:
+                session.delete(instance)
+            else:
+                if attempt:
+                    for key, value in values.items():
+                        setattr(instance, key, value)
+                session.add(instance)
+            session.commit()
+            return
+        except OperationalError as error:
+            session.rollback()
+            if 'database is locked' not in str(error.orig) or attempt == retries:
+                raise
+            metrics.DB_LOCK_RETRIES.labels(operation).inc()
+            time.sleep(backoff * (2 ** attempt))
+
 from .user import User
 from .entry import Entry
+from .archive import ArchivedEntry, ArchivedDailyTotal
+from .entry_change import EntryChange
+from .nutrition import NutritionFact
+from .food import Food
@@ -0,0 +1,115 @@
+'''Archived entries and their daily totals, see archive.py for the job moving them'''
+
+from sqlalchemy.orm import aliased
+from . import db
+from .entry import Entry, EntryRecord
+
+class ArchivedEntry(EntryRecord, db.Model):
+    '''
+        an entry older than the archive cutoff, moved out of the entries table
+        with its id; read only, writes restore it into entries first
+    '''
+    __tablename__ = 'archived_entries'
+    __table_args__ = (
+        db.Index('ix_archived_entries_user_id_date', 'user_id', 'date'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False)
+    time = db.Column(db.Time, nullable=False)
+    food_id = db.Column(db.Integer, db.ForeignKey('foods.id'), nullable=False)
+    calories = db.Column(db.Integer)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+
+class ArchivedDailyTotal(db.Model):
+    '''calories of the archived entries of a user on one day (entries without calories count as 0)'''
+    __tablename__ = 'archived_daily_totals'
+    __table_args__ = (
+        db.Index('ix_archived_daily_totals_date', 'date'),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    calories = db.Column(db.Integer, nullable=False, default=0)
+
+
+def archived_total(user_id, date):
+    '''archived calories of a day as a scalar subquery (0 when nothing of the day is archived)'''
+    return db.func.coalesce(
+        db.select(ArchivedDailyTotal.calories)
+        .where(ArchivedDailyTotal.user_id == user_id, ArchivedDailyTotal.date == date)
+        .scalar_subquery(),
+        0
+    )
+
+
+def horizon_statement():
+    '''date of the newest archived day, everything after it is only in entries'''
+    return db.select(db.func.max(ArchivedDailyTotal.date))
+
+
+def needs_archive(horizon, start_date):
+    '''a listing from start_date (None = all history) reaches into the archive'''
+    return horizon is not None and (start_date is None or start_date <= horizon)
+
+
+def entry_source(include_archive):
+    '''
+        entity to list entries from: Entry, or Entry mapped over entries UNION ALL
+        archived_entries. Archived rows come back as read only Entry objects
+    '''
+    if not include_archive:
+        return Entry
+    columns = [column.name for column in Entry.__table__.columns]
+    union = db.union_all(
+        db.select(*[Entry.__table__.c[name] for name in columns]),
+        db.select(*[ArchivedEntry.__table__.c[name] for name in columns])
+    ).subquery('all_entries')
+    return aliased(Entry, union)
+
+
+'''sqlite_sequence row of entries, where AUTOINCREMENT keeps the highest id it handed out'''
+entry_sequence = db.table('sqlite_sequence', db.column('name'), db.column('seq'))
+
+
+def highest_entry_id():
+    '''
+        highest id an entry of this database ever had: the sequence of entries, or an
+        archived id when entries were copied into archived_entries directly (flask shards
+        reshard); the largest id in entries covers shard files made before AUTOINCREMENT
+    '''
+    sequence = db.select(entry_sequence.c.seq).where(entry_sequence.c.name == 'entries').scalar_subquery()
+    archived = db.select(db.func.max(ArchivedEntry.id)).scalar_subquery()
+    current = db.select(db.func.max(Entry.id)).scalar_subquery()
+    return db.func.max(db.func.coalesce(sequence, 0), db.func.coalesce(archived, 0), db.func.coalesce(current, 0))
+
+
+def reserve_archived_ids(connection):
+    '''raise the sequence of entries over every archived id, so new entries never get one'''
+    highest = connection.execute(db.select(highest_entry_id())).scalar()
+    updated = connection.execute(
+        entry_sequence.update().where(entry_sequence.c.name == 'entries').values(seq=highest)
+    ).rowcount
+    if not updated and highest:
+        connection.execute(entry_sequence.insert().values(name='entries', seq=highest))
+
+
+def restore_statements(archived):
+    '''
+        statements moving one archived entry back into entries (run in one transaction):
+        its calories leave the archived daily total, which is dropped when the day has
+        no archived entries left
+    '''
+    values = {column.name: getattr(archived, column.key) for column in ArchivedEntry.__table__.columns}
+    totals = ArchivedDailyTotal.__table__
+    day = (totals.c.user_id == archived.user_id) & (totals.c.date == archived.date)
+    remaining = db.select(db.func.count()).select_from(ArchivedEntry.__table__).where(
+        ArchivedEntry.user_id == archived.user_id, ArchivedEntry.date == archived.date
+    ).scalar_subquery()
+    return [
+        # the archive row goes first, so the change feed ends with the upsert of the insert
+        ArchivedEntry.__table__.delete().where(ArchivedEntry.id == archived.id),
+        Entry.__table__.insert().values(values),
+        totals.update().where(day).values(calories=totals.c.calories - (archived.calories or 0)),
+        totals.delete().where(day, remaining == 0)
+    ]
@@ -1,84 +1,118 @@
 ''' Entry model definition and methods'''
 
-import requests
-from . import db
-
-class Entry(db.Model):
-    __tablename__ = 'entries'
-
-    id = db.Column(db.Integer, primary_key=True)
-    date = db.Column(db.Date, nullable=False)
-    time = db.Column(db.Time, nullable=False)
-    text = db.Column(db.String(255), nullable=False)
-    calories = db.Column(db.Integer)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+from sqlalchemy.orm import object_session
+import foods
+import sharding
+from . import db, commit_with_retry
 
+class EntryRecord:
     '''
-    bidirectional relationship between the User and Entry model 
+        behaviour shared by entries and archived entries (models/archive.py),
+        both tables have the same columns
     '''
-    user = db.relationship('User', back_populates='entries')
 
-    def __init__(self, date, time, text, calories=None, user_id=None):
-        self.date = date
-        self.time = time
-        self.text = text
-        self.calories = calories
-        self.user_id = user_id
+    '''entry text, stored once in the foods dictionary'''
+    @property
+    def text(self):
+        return foods.text_of(self.food_id)
+
+    @text.setter
+    def text(self, text):
+        self.food_id = foods.intern(text)
 
     '''
         calculate calories if calories is not given as input by the user
-        API call to https://www.nutritionix.com
+        from the local nutrition table, falling back to https://www.nutritionix.com;
+        the result is kept per food, so each text is resolved once
     '''
     def calculate_calories(self):
         if self.calories is None:
-            api_url = 'https://trackapi.nutritionix.com/v2/natural/nutrients'
-            headers = {
-                'Content-Type': 'application/json', 
-                'x-app-id': '630dceac', 
-                'x-app-key': '8e923dd3df9048bc4c9da8e92928d4bb'
-            }
-            payload = {'query': self.text}
-
-            try:
-                response = requests.post(api_url, json=payload, headers=headers)
-                if response.status_code == 200:
-                    '''extracting calories from response data'''
-                    self.calories = response.json()['foods'][0]['nf_calories']
-                else:
-                    self.calories = None
-            except requests.exceptions.RequestException:
-                self.calories = None
+            self.calories = foods.calories_of(self.food_id)
 
     @property
     def is_calorie_intake_less_than_expected(self):
         '''check if the calorie intake is less than expected daily calorie intake'''
+        # without calories of its own the entry counts those of its food (looked up, not saved)
+        looked_up = 0
         if self.calories is None:
-            self.calculate_calories()
+            looked_up = foods.calories_of(self.food_id) or 0
+
+        '''
+            total calories consumed on a given date, entries without calories count as 0;
+            the archived total of the day is added in the same query
+        '''
+        from .archive import archived_total
+        total_calories = self._session().query(
+            db.func.coalesce(db.func.sum(Entry.calories), 0) + archived_total(self.user_id, self.date)
+        ).filter(Entry.user_id == self.user_id, Entry.date == self.date).scalar()
+        return total_calories + looked_up <= self._expected_daily_calories()
+
+    def _session(self):
+        '''session the entry belongs to, or the one of the user's shard'''
+        return object_session(self) or sharding.session_for(self.user_id)
 
-        '''total calories consumed on a given date'''
-        total_calories = Entry.query.filter_by(user_id=self.user_id, date=self.date).with_entities(db.func.sum(Entry.calories)).scalar()
-        return total_calories <= self.user.expected_daily_calories
+    def _expected_daily_calories(self):
+        '''users stay in the main database when entries are sharded, so self.user cannot be used'''
+        from .user import User
+        return db.session.get(User, self.user_id).expected_daily_calories
 
-    '''serialize entry data'''
-    def serialize(self):
+    '''
+        serialize entry data, callers that already know the daily total
+        pass the flag instead of querying it again
+    '''
+    def serialize(self, is_calorie_intake_less_than_expected=None):
+        calories = self.calories
+        if is_calorie_intake_less_than_expected is None:
+            is_calorie_intake_less_than_expected = self.is_calorie_intake_less_than_expected
         return {
             'id': self.id,
             'date': self.date.strftime('%Y-%m-%d'),
             'time': self.time.strftime('%H:%M:%S'),
             'text': self.text,
-            'calories': self.calories,
-            'is_calorie_intake_less_than_expected': self.is_calorie_intake_less_than_expected,
+            'calories': calories,
+            'is_calorie_intake_less_than_expected': is_calorie_intake_less_than_expected,
             'user_id': self.user_id
         }
 
+class Entry(EntryRecord, db.Model):
+    __tablename__ = 'entries'
+    '''
+        ids are never reused (not even the one of the newest entry after it is
+        deleted): archived entries and change feed rows keep the ids of entries
+        that are no longer in this table
+    '''
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False)
+    time = db.Column(db.Time, nullable=False)
+    food_id = db.Column(db.Integer, db.ForeignKey('foods.id'), nullable=False, index=True)
+    calories = db.Column(db.Integer)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+
+    '''
+    bidirectional relationship between the User and Entry model 
+    '''
+    user = db.relationship('User', back_populates='entries')
+
+    def __init__(self, date, time, text=None, calories=None, user_id=None, food_id=None):
+        self.date = date
+        self.time = time
+        if text is not None:
+            self.text = text
+        else:
+            self.food_id = food_id
+        self.calories = calories
+        self.user_id = user_id
+
     '''delete entry'''   
     def delete(self):
-        db.session.delete(self)
-        db.session.commit()
+        commit_with_retry(self, 'entry_delete', delete=True, session=self._session())
 
     '''save entry'''
     def save(self):
         if self.calories is None:
             self.calculate_calories()
-        db.session.add(self)
-        db.session.commit()
+        if self.id is None and sharding.enabled():
+            self.id = sharding.next_id(self.user_id)
+        commit_with_retry(self, 'entry_save', session=self._session())
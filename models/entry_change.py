@@ -0,0 +1,174 @@
+'''EntryChange model definition and the change feed of entries'''
+
+from . import db
+from .entry import Entry
+from .archive import ArchivedEntry
+
+class EntryChange(db.Model):
+    '''
+        latest change of an entry in the change feed, ordered by seq.
+        Rows are written by the triggers below, so every way of writing entries
+        (ORM, group commit, the user delete cascade, resharding) is recorded.
+        An entry keeps only its newest row: an 'upsert' while it exists and a
+        'delete' tombstone afterwards. 'reset' rows mark where the entries of the
+        database were replaced wholesale (flask shards reshard); older cursors
+        cannot be continued from there.
+    '''
+    __tablename__ = 'entry_changes'
+    __table_args__ = (
+        db.Index('ix_entry_changes_user_id_seq', 'user_id', 'seq'),
+        {'sqlite_autoincrement': True}
+    )
+
+    seq = db.Column(db.Integer, primary_key=True)
+    entry_id = db.Column(db.Integer, nullable=False, index=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)
+
+    def serialize(self, entry=None):
+        return {
+            'seq': self.seq,
+            'op': self.op,
+            'entry_id': self.entry_id,
+            'user_id': self.user_id,
+            'entry': entry
+        }
+
+ENTRY_CHANGE_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS entries_change_on_insert AFTER INSERT ON entries BEGIN
+        DELETE FROM entry_changes WHERE entry_id = NEW.id;
+        INSERT INTO entry_changes (entry_id, user_id, op) VALUES (NEW.id, NEW.user_id, 'upsert');
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS entries_change_on_update AFTER UPDATE ON entries BEGIN
+        DELETE FROM entry_changes WHERE entry_id = NEW.id;
+        INSERT INTO entry_changes (entry_id, user_id, op) VALUES (NEW.id, NEW.user_id, 'upsert');
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS entries_change_on_delete AFTER DELETE ON entries BEGIN
+        DELETE FROM entry_changes WHERE entry_id = OLD.id;
+        INSERT INTO entry_changes (entry_id, user_id, op) VALUES (OLD.id, OLD.user_id, 'delete');
+    END
+    '''
+]
+'''archived entries are only deleted for good (user delete) or on their way back into entries'''
+ARCHIVED_ENTRY_CHANGE_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS archived_entries_change_on_delete AFTER DELETE ON archived_entries BEGIN
+        DELETE FROM entry_changes WHERE entry_id = OLD.id;
+        INSERT INTO entry_changes (entry_id, user_id, op) VALUES (OLD.id, OLD.user_id, 'delete');
+    END
+    '''
+]
+
+'''
+    db.create_all() (and every new shard) creates the triggers once both tables
+    exist; entries already in the database start out as one upsert each
+'''
+def _create_triggers(target, connection, **kw):
+    inspector = db.inspect(connection)
+    if not inspector.has_table('entry_changes'):
+        return
+    if target is EntryChange.__table__ and inspector.has_table('entries'):
+        connection.execute(db.text(
+            "INSERT INTO entry_changes (entry_id, user_id, op) SELECT id, user_id, 'upsert' FROM entries ORDER BY id"
+        ))
+    triggers = {'entries': ENTRY_CHANGE_TRIGGERS, 'archived_entries': ARCHIVED_ENTRY_CHANGE_TRIGGERS}
+    for table, statements in triggers.items():
+        if inspector.has_table(table):
+            for trigger in statements:
+                connection.exec_driver_sql(trigger)
+
+for table in (Entry.__table__, ArchivedEntry.__table__, EntryChange.__table__):
+    db.event.listen(table, 'after_create', _create_triggers)
+
+
+def feed_statement(since, user_id=None, limit=100):
+    '''changes after seq `since`, of one user or (user_id None) of everyone'''
+    statement = db.select(EntryChange).where(EntryChange.seq > since, EntryChange.op != 'reset')
+    if user_id is not None:
+        statement = statement.where(EntryChange.user_id == user_id)
+    return statement.order_by(EntryChange.seq).limit(limit)
+
+
+def reset_statement():
+    '''seq of the last reset marker, cursors between 0 and it are stale'''
+    return db.select(db.func.max(EntryChange.seq)).where(EntryChange.op == 'reset')
+
+
+def reset_marker():
+    return EntryChange.__table__.insert().values(entry_id=0, user_id=0, op='reset')
+
+
+def archived_upserts():
+    '''
+        statements writing one upsert per archived entry, for archived rows copied
+        into a database without going through entries (flask shards reshard)
+    '''
+    changes = EntryChange.__table__
+    archived = ArchivedEntry.__table__
+    return [
+        changes.delete().where(changes.c.entry_id.in_(db.select(archived.c.id))),
+        changes.insert().from_select(
+            ['entry_id', 'user_id', 'op'],
+            db.select(archived.c.id, archived.c.user_id, db.literal('upsert')).order_by(archived.c.id)
+        )
+    ]
+
+
+'''
+    a sync cursor holds one seq per database holding entries, "12" for the main
+    database and "12.40.7" when entries are sharded; None when it cannot be parsed
+'''
+def parse_cursor(value, parts):
+    if value is None or value == '0':
+        return [0] * parts
+    try:
+        seqs = [int(part) for part in str(value).split('.')]
+    except ValueError:
+        return None
+    if any(seq < 0 for seq in seqs):
+        return None
+    return seqs
+
+
+def format_cursor(seqs):
+    return seqs[0] if len(seqs) == 1 else '.'.join(str(seq) for seq in seqs)
+
+
+def merge_feeds(feeds, cursor, limit):
+    '''
+        combine the feeds of several databases ({index: rows, up to limit + 1 each}) into
+        one page of at most limit changes; returns the changes, the next cursor and has_more.
+        Databases are drained in order, the cursor only advances past rows actually returned
+    '''
+    cursor = list(cursor)
+    changes = []
+    has_more = False
+    for index in sorted(feeds):
+        rows = feeds[index]
+        taken = rows[:limit - len(changes)]
+        changes.extend(taken)
+        if taken:
+            cursor[index] = taken[-1].seq
+        if len(taken) < len(rows):
+            has_more = True
+    return changes, cursor, has_more
+
+
+def serialize_changes(changes, entries):
+    '''
+        changes of a page with the serialized entry ({entry_id: dict}) of each upsert;
+        an upsert whose entry was deleted after the feed was read is left out, its
+        tombstone follows in a later page
+    '''
+    result = []
+    for change in changes:
+        if change.op != 'upsert':
+            result.append(change.serialize())
+        elif change.entry_id in entries:
+            result.append(change.serialize(entries[change.entry_id]))
+    return result
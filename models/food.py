@@ -0,0 +1,17 @@
+'''Food model definition'''
+
+from . import db
+
+class Food(db.Model):
+    '''
+        one distinct entry text, stored once and referenced by entries.food_id;
+        key (foods.food_key) groups texts that only differ in case or spacing;
+        calories caches what the text resolved to (cleared when the nutrition
+        table is re-imported)
+    '''
+    __tablename__ = 'foods'
+
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(255), index=True, nullable=False)
+    text = db.Column(db.String(255), unique=True, nullable=False)
+    calories = db.Column(db.Integer)
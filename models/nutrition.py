@@ -0,0 +1,34 @@
+'''NutritionFact model definition'''
+
+from . import db
+
+class NutritionFact(db.Model):
+    '''
+        one serving of a food in the local nutrition table,
+        e.g. "chicken": 1 bowl (150 g) = 250 calories
+    '''
+    __tablename__ = 'nutrition_facts'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), unique=True, nullable=False)
+    calories = db.Column(db.Float, nullable=False)
+    unit = db.Column(db.String(50), nullable=False, default='serving')
+    quantity = db.Column(db.Float, nullable=False, default=1)
+    grams = db.Column(db.Float)
+
+    def __init__(self, name, calories, unit='serving', quantity=1, grams=None):
+        self.name = name
+        self.calories = calories
+        self.unit = unit
+        self.quantity = quantity
+        self.grams = grams
+
+    def serialize(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'calories': self.calories,
+            'unit': self.unit,
+            'quantity': self.quantity,
+            'grams': self.grams
+        }
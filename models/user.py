@@ -1,9 +1,11 @@
 '''User model definition and methods'''
 
-from . import db
+from . import db, commit_with_retry
 from flask import current_app
 from werkzeug.security import generate_password_hash, check_password_hash
 from .entry import Entry
+from .archive import ArchivedEntry, ArchivedDailyTotal
+import sharding
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -52,12 +54,14 @@ class User(db.Model):
         }
 
     def delete(self):
-        db.session.delete(self)
-        db.session.commit()
+        user_id = self.id
+        commit_with_retry(self, 'user_delete', delete=True)
+        if sharding.enabled():
+            # entries live in the user's shard, out of reach of the cascade below
+            sharding.delete_user_rows(user_id)
 
     def save(self):
-        db.session.add(self)
-        db.session.commit()
+        commit_with_retry(self, 'user_save')
 
 '''
     SQLAlchemy event listener that is triggered after a User object is deleted from the database. 
@@ -68,3 +72,5 @@ def delete_user_entries(mapper, connection, target):
     connection.execute(
         Entry.__table__.delete().where(Entry.user_id == target.id)
     )
+    for table in (ArchivedEntry.__table__, ArchivedDailyTotal.__table__):
+        connection.execute(table.delete().where(table.c.user_id == target.id))
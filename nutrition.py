@@ -0,0 +1,379 @@
+'''
+    Calorie resolution for entry text
+    Free text like "4 bowls chicken" is parsed into quantity, unit and food and
+    resolved against the local nutrition table (nutrition_facts), which is kept
+    in an in-memory trigram index. Nutritionix is only called when the local
+    match is not confident enough; its answers are cached for all workers in
+    shared_state. When it is unreachable a weaker local match
+    (NUTRITION_FALLBACK_CONFIDENCE) is used instead.
+
+    flask nutrition import <file.csv>    load rows (name,calories,unit,quantity,grams)
+    flask nutrition lookup "<text>"      show how a text would be resolved
+'''
+import csv
+import math
+import re
+import threading
+import time
+from collections import Counter
+from fractions import Fraction
+import click
+import requests
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy.dialects.sqlite import insert
+import metrics
+import shared_state
+from models import db
+from models.nutrition import NutritionFact
+from models.food import Food
+
+nutrition_cli = AppGroup('nutrition', help='Manage the local nutrition table.')
+
+NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6,
+    'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'half': 0.5, 'dozen': 12
+}
+'''unit spellings -> (canonical unit, grams per unit for mass units)'''
+UNITS = {
+    'g': ('g', 1), 'gm': ('g', 1), 'gram': ('g', 1), 'grams': ('g', 1),
+    'kg': ('g', 1000), 'kilo': ('g', 1000), 'kilos': ('g', 1000),
+    'oz': ('g', 28.35), 'ounce': ('g', 28.35), 'ounces': ('g', 28.35),
+    'lb': ('g', 453.6), 'lbs': ('g', 453.6), 'pound': ('g', 453.6), 'pounds': ('g', 453.6),
+    'bowl': ('bowl', None), 'bowls': ('bowl', None),
+    'cup': ('cup', None), 'cups': ('cup', None),
+    'glass': ('glass', None), 'glasses': ('glass', None),
+    'plate': ('plate', None), 'plates': ('plate', None),
+    'slice': ('slice', None), 'slices': ('slice', None),
+    'piece': ('piece', None), 'pieces': ('piece', None), 'pcs': ('piece', None),
+    'serving': ('serving', None), 'servings': ('serving', None),
+    'tbsp': ('tbsp', None), 'tablespoon': ('tbsp', None), 'tablespoons': ('tbsp', None),
+    'tsp': ('tsp', None), 'teaspoon': ('tsp', None), 'teaspoons': ('tsp', None),
+    'handful': ('handful', None), 'handfuls': ('handful', None),
+}
+QUANTITY = re.compile(r'^(\d+\s+\d+/\d+|\d+/\d+|\d*\.\d+|\d+)\s*')
+ITEM_SEPARATOR = re.compile(r'\s*(?:,|;|\+|\band\b|\bwith\b)\s*')
+
+
+def normalize(text):
+    '''lowercase, drop punctuation and plural endings so "Eggs!" and "egg" compare equal'''
+    words = []
+    for word in re.sub(r'[^a-z0-9 ]+', ' ', text.lower()).split():
+        if len(word) > 4 and word.endswith('ies'):
+            word = word[:-3] + 'y'
+        elif len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        words.append(word)
+    return ' '.join(words)
+
+
+def parse_quantity(text):
+    '''
+        split "4 bowls chicken" into (4.0, 'bowl', grams per unit, 'chicken');
+        unit is None when the text has no unit, quantity defaults to 1
+    '''
+    rest = text.strip().lower()
+    quantity = 1.0
+    match = QUANTITY.match(rest)
+    if match:
+        try:
+            quantity = float(sum(Fraction(part) for part in match.group(1).split()))
+        except (ZeroDivisionError, ValueError):
+            # "1/0 apple": not a usable amount, one serving of the food
+            quantity = 1.0
+        rest = rest[match.end():]
+    else:
+        first, _, remainder = rest.partition(' ')
+        if first in NUMBER_WORDS and remainder:
+            quantity = float(NUMBER_WORDS[first])
+            rest = remainder
+
+    unit = grams_per_unit = None
+    first, _, remainder = rest.partition(' ')
+    if first in UNITS and remainder:
+        unit, grams_per_unit = UNITS[first]
+        rest = remainder
+    if rest.startswith('of '):
+        rest = rest[3:]
+    return quantity, unit, grams_per_unit, rest.strip()
+
+
+def _trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FoodIndex:
+    '''
+        in-memory trigram index over the nutrition table;
+        exact names are a dict hit, anything else is ranked by trigram Jaccard similarity
+    '''
+    def __init__(self, facts):
+        self.facts = {}
+        self.by_name = {}
+        self.postings = {}
+        self.sizes = {}
+        for fact in facts:
+            key = normalize(fact.name)
+            self.facts[fact.id] = fact
+            self.by_name[key] = fact
+            grams = _trigrams(key)
+            self.sizes[fact.id] = len(grams)
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(fact.id)
+
+    def __len__(self):
+        return len(self.facts)
+
+    def match(self, food):
+        '''best (fact, confidence) for a food name, (None, 0.0) if nothing shares a trigram'''
+        key = normalize(food)
+        if key in self.by_name:
+            return self.by_name[key], 1.0
+
+        grams = _trigrams(key)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+        if not shared:
+            return None, 0.0
+
+        best_id, best_score = None, 0.0
+        for fact_id, count in shared.items():
+            score = count / (len(grams) + self.sizes[fact_id] - count)
+            if score > best_score:
+                best_id, best_score = fact_id, score
+        return self.facts[best_id], best_score
+
+
+def _calories_for(fact, quantity, unit, grams_per_unit):
+    '''scale a serving to the parsed amount, returns (calories, confidence factor)'''
+    if unit is None:
+        return fact.calories * quantity, 1.0
+    # quantity/grams of 0 are refused by the import, but may predate that check
+    if unit == fact.unit and fact.quantity:
+        return fact.calories * quantity / fact.quantity, 1.0
+    if grams_per_unit is not None and fact.grams:
+        return fact.calories * quantity * grams_per_unit / fact.grams, 1.0
+    # unit we cannot convert, treat it as a number of servings
+    return fact.calories * quantity, 0.8
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    '''the food index of this process, loaded from the nutrition table on first use'''
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                facts = db.session.execute(db.select(NutritionFact.__table__)).all()
+                _index = FoodIndex(facts)
+    return _index
+
+
+def reload_index():
+    global _index
+    with _index_lock:
+        _index = None
+    return get_index()
+
+
+def load_index(facts):
+    '''install an index built from already fetched rows (used by the async app)'''
+    global _index
+    with _index_lock:
+        _index = FoodIndex(facts)
+    return _index
+
+
+def resolve_locally(text, min_confidence=0.6):
+    '''(calories, confidence) from the local table, whole text first then item by item'''
+    index = get_index()
+    if not len(index):
+        return None, 0.0
+
+    whole = _resolve_item(index, text)
+    if whole[1] >= min_confidence:
+        return whole
+    items = [item for item in ITEM_SEPARATOR.split(text) if item]
+    if len(items) < 2:
+        return whole
+
+    resolved = [_resolve_item(index, item) for item in items]
+    if any(calories is None for calories, _ in resolved):
+        return whole
+    split = sum(calories for calories, _ in resolved), min(confidence for _, confidence in resolved)
+    return max(whole, split, key=lambda result: result[1])
+
+
+def _resolve_item(index, text):
+    quantity, unit, grams_per_unit, food = parse_quantity(text)
+    fact, confidence = index.match(food)
+    if fact is None:
+        return None, 0.0
+    calories, factor = _calories_for(fact, quantity, unit, grams_per_unit)
+    return calories, confidence * factor
+
+
+def local_calories(text, config):
+    '''(calories, confidence, confident) from the local table, recorded as provider "local"'''
+    start = time.perf_counter()
+    calories, confidence = resolve_locally(text, config.get('NUTRITION_MIN_CONFIDENCE', 0.6))
+    confident = calories is not None and confidence >= config.get('NUTRITION_MIN_CONFIDENCE', 0.6)
+    metrics.observe_provider('local', 'hit' if confident else 'miss', time.perf_counter() - start)
+    return calories, confidence, confident
+
+
+def fallback_calories(calories, confidence, config):
+    '''weaker local match used when Nutritionix has no answer'''
+    if calories is not None and confidence >= config.get('NUTRITION_FALLBACK_CONFIDENCE', 0.3):
+        return round(calories)
+    return None
+
+
+def nutritionix_request(text, config):
+    '''url and keyword arguments for a Nutritionix natural language query'''
+    headers = {
+        'Content-Type': 'application/json',
+        'x-app-id': config['NUTRITIONIX_APP_ID'],
+        'x-app-key': config['NUTRITIONIX_APP_KEY']
+    }
+    return config['NUTRITIONIX_API_URL'], {
+        'json': {'query': text},
+        'headers': headers,
+        'timeout': config.get('NUTRITIONIX_TIMEOUT', 5)
+    }
+
+
+def fetch_nutritionix_calories(text, config):
+    '''
+        calculate calories with an API call to https://www.nutritionix.com,
+        None when the provider cannot be reached or does not know the food
+    '''
+    api_url, kwargs = nutritionix_request(text, config)
+    start = time.perf_counter()
+    calories = None
+    try:
+        response = requests.post(api_url, **kwargs)
+        if response.status_code == 200:
+            '''extracting calories from response data'''
+            calories = response.json()['foods'][0]['nf_calories']
+            outcome = 'success'
+        else:
+            outcome = 'http_error'
+    except requests.exceptions.RequestException:
+        outcome = 'network_error'
+    metrics.observe_provider('nutritionix', outcome, time.perf_counter() - start)
+    return calories
+
+
+def cached_nutritionix_calories(text):
+    '''Nutritionix answer already fetched by any worker, None if unknown'''
+    return shared_state.get('nutritionix:' + normalize(text))
+
+
+def remember_nutritionix_calories(text, calories, config):
+    if calories is not None:
+        shared_state.put('nutritionix:' + normalize(text), calories, config.get('NUTRITIONIX_CACHE_TTL', 86400))
+
+
+def nutritionix_allowed(config):
+    '''outbound call budget per minute, counted across all workers'''
+    limit = config.get('NUTRITIONIX_RATE_LIMIT')
+    if not limit:
+        return True
+    allowed = shared_state.incr('nutritionix:calls', 60) <= limit
+    if not allowed:
+        metrics.PROVIDER_REQUESTS.labels('nutritionix', 'rate_limited').inc()
+    return allowed
+
+
+def resolve_calories(text):
+    '''
+        calories for an entry text: local table, then Nutritionix, then the best local guess;
+        returns (calories, final), final is False for the guess, which may improve later
+    '''
+    config = current_app.config
+    calories, confidence, confident = local_calories(text, config)
+    if confident:
+        return round(calories), True
+
+    remote = cached_nutritionix_calories(text)
+    if remote is None and nutritionix_allowed(config):
+        remote = fetch_nutritionix_calories(text, config)
+        remember_nutritionix_calories(text, remote, config)
+    if remote is not None:
+        return remote, True
+    return fallback_calories(calories, confidence, config), False
+
+
+def _number(row, column, line, default=None, positive=False):
+    '''a number cell of the import, a click error naming the line when it is not usable'''
+    cell = (row.get(column) or '').strip()
+    if not cell:
+        return default
+    try:
+        value = float(cell)
+    except ValueError:
+        raise click.ClickException(f'line {line}: {column} is not a number: {cell!r}')
+    if not math.isfinite(value) or value < 0 or (positive and value == 0):
+        raise click.ClickException(f'line {line}: {column} must be {"above" if positive else "at least"} 0, got {cell}')
+    return value
+
+
+def _fact_row(row, line):
+    return {
+        'name': row['name'].strip().lower(),
+        'calories': _number(row, 'calories', line),
+        'unit': (row.get('unit') or 'serving').strip().lower(),
+        'quantity': _number(row, 'quantity', line, default=1, positive=True),
+        'grams': _number(row, 'grams', line, positive=True)
+    }
+
+
+@nutrition_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--replace', is_flag=True, help='Delete the current table before importing.')
+def import_nutrition(path, replace):
+    '''import a CSV with columns name,calories[,unit,quantity,grams]'''
+    with open(path, newline='', encoding='utf-8') as csv_file:
+        reader = csv.DictReader(csv_file)
+        rows = [_fact_row(row, reader.line_num) for row in reader if row.get('name') and row.get('calories')]
+
+    if replace:
+        db.session.execute(db.delete(NutritionFact))
+    # chunked to stay under SQLite's bound parameter limit
+    for start in range(0, len(rows), 500):
+        statement = insert(NutritionFact).values(rows[start:start + 500])
+        statement = statement.on_conflict_do_update(
+            index_elements=['name'],
+            set_={column: statement.excluded[column] for column in ('calories', 'unit', 'quantity', 'grams')}
+        )
+        db.session.execute(statement)
+    # calories stored per food were resolved against the old table
+    db.session.execute(db.update(Food).values(calories=None))
+    db.session.commit()
+    click.echo(f'Imported {len(rows)} foods, {len(reload_index())} in the table')
+
+
+@nutrition_cli.command('lookup')
+@click.argument('text')
+def lookup_nutrition(text):
+    '''show how an entry text is resolved locally'''
+    quantity, unit, _, food = parse_quantity(text)
+    get_index()
+    start = time.perf_counter()
+    calories, confidence = resolve_locally(text, current_app.config.get('NUTRITION_MIN_CONFIDENCE', 0.6))
+    elapsed = (time.perf_counter() - start) * 1e6
+    click.echo(f'quantity={quantity:g} unit={unit} food={food!r}')
+    if calories is None:
+        click.echo('no local match')
+    else:
+        click.echo(f'calories={calories:.0f} confidence={confidence:.2f} ({elapsed:.0f} us)')
+
+
+def init_app(app):
+    app.cli.add_command(nutrition_cli)
@@ -0,0 +1,58 @@
+'''
+    Page of results for lists that are not paginated by Flask-SQLAlchemy
+    (async app, entries merged from several shards, Core row selects)
+'''
+from flask import abort
+from sqlalchemy import func, select
+
+
+class Page:
+    '''the subset of Flask-SQLAlchemy's Pagination the routes serialize'''
+    def __init__(self, items, total, page, per_page):
+        self.items = items
+        self.total = total
+        self.page = page
+        self.per_page = per_page
+
+    @property
+    def pages(self):
+        if not self.total:
+            return 0
+        return (self.total + self.per_page - 1) // self.per_page
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+
+def check_page(page, per_page):
+    '''same rules as Query.paginate: 404 on page/per_page < 1'''
+    if page < 1 or per_page < 1:
+        abort(404)
+
+
+def count_statement(statement):
+    return select(func.count()).select_from(statement.order_by(None).subquery())
+
+
+def page_statement(statement, page, per_page):
+    return statement.limit(per_page).offset((page - 1) * per_page)
+
+
+def page_of(items, total, page, per_page):
+    '''Page of the rows read with page_statement, 404 for an empty page past the first'''
+    if not items and page != 1:
+        abort(404)
+    return Page(items, total, page, per_page)
+
+
+def paginate(session, statement, page, per_page):
+    '''Query.paginate for a Core select: a Page of rows'''
+    check_page(page, per_page)
+    total = session.execute(count_statement(statement)).scalar()
+    items = session.execute(page_statement(statement, page, per_page)).all()
+    return page_of(items, total, page, per_page)
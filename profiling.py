@@ -0,0 +1,167 @@
+'''
+    Opt-in profiling of live requests
+    A request is profiled with cProfile when an admin sends the profile header
+    (X-Profile: 1 by default) or when it is picked by PROFILE_SAMPLE_RATE.
+    Each trace is written to PROFILE_DIR as
+        <timestamp>_<duration>ms_<method>_<route>_<filters>.prof
+    and only the newest PROFILE_MAX_FILES traces are kept.
+
+    flask profiles list              list captured traces
+    flask profiles show <file>       print the top functions of a trace
+'''
+import cProfile
+import os
+import pstats
+import random
+import re
+import time
+from datetime import datetime
+import click
+import jwt
+from flask import current_app, g, request
+from flask.cli import AppGroup
+from routes.auth import decode_access_token
+
+profiles_cli = AppGroup('profiles', help='List and summarize captured request profiles.')
+
+
+def _profile_dir(app):
+    return os.path.join(app.instance_path, app.config.get('PROFILE_DIR', 'profiles'))
+
+
+def _requested_by_admin():
+    '''cheap pre-check on the token claims, the stored role is checked again before writing'''
+    access_token = request.headers.get('Authorization')
+    if not access_token:
+        return False
+    try:
+        return decode_access_token(access_token).get('role') == 'admin'
+    except jwt.InvalidTokenError:
+        return False
+
+
+def _start_profile():
+    config = current_app.config
+    requested = request.headers.get(config.get('PROFILE_HEADER', 'X-Profile')) == '1'
+    sampled = random.random() < config.get('PROFILE_SAMPLE_RATE', 0.0)
+    if not sampled and not (requested and _requested_by_admin()):
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # another profiler is already active in this process
+        return
+    g._profiler = profiler
+    g._profile_sampled = sampled
+    g._profile_start = time.perf_counter()
+
+
+def _slug(value, limit=60):
+    return re.sub(r'[^A-Za-z0-9.=-]+', '-', value).strip('-')[:limit]
+
+
+def _profile_filename(duration_ms):
+    rule = request.url_rule.rule if request.url_rule else request.path
+    filters = '_'.join(f'{key}={value}' for key, value in sorted(request.args.items(multi=True)))
+    parts = [
+        datetime.now().strftime('%Y%m%dT%H%M%S%f'),
+        f'{duration_ms:.0f}ms',
+        request.method,
+        _slug(rule) or 'root',
+    ]
+    if filters:
+        parts.append(_slug(filters, limit=120))
+    return '_'.join(parts) + '.prof'
+
+
+def _profiles(directory):
+    '''
+        (mtime, entry) of the traces in directory, oldest first; traces removed
+        meanwhile by another worker rotating the same directory are skipped
+    '''
+    profiles = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.prof'):
+            try:
+                profiles.append((entry.stat().st_mtime, entry))
+            except FileNotFoundError:
+                continue
+    return sorted(profiles, key=lambda profile: profile[0])
+
+
+def _rotate(directory, keep):
+    profiles = _profiles(directory)
+    for _, entry in profiles[:max(len(profiles) - keep, 0)]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            # another worker rotated it first
+            pass
+
+
+def _stop_profile(response):
+    profiler = g.pop('_profiler', None)
+    if profiler is None:
+        return response
+    profiler.disable()
+    duration_ms = (time.perf_counter() - g.pop('_profile_start')) * 1000
+
+    # header triggered traces are only kept for users that really are admins
+    current_user = g.get('current_user')
+    is_admin = current_user is not None and current_user.role == 'admin'
+    if not g.pop('_profile_sampled') and not is_admin:
+        return response
+
+    directory = _profile_dir(current_app)
+    os.makedirs(directory, exist_ok=True)
+    filename = _profile_filename(duration_ms)
+    profiler.dump_stats(os.path.join(directory, filename))
+    _rotate(directory, current_app.config.get('PROFILE_MAX_FILES', 200))
+
+    if is_admin:
+        response.headers['X-Profile-File'] = filename
+    return response
+
+
+def _discard_profile(exception):
+    profiler = g.pop('_profiler', None)
+    if profiler is not None:
+        profiler.disable()
+
+
+@profiles_cli.command('list')
+def list_profiles():
+    '''list captured profiles, newest first'''
+    directory = _profile_dir(current_app)
+    if not os.path.isdir(directory):
+        click.echo('No profiles captured yet.')
+        return
+
+    for _, entry in reversed(_profiles(directory)):
+        try:
+            stats = pstats.Stats(entry.path)
+        except FileNotFoundError:
+            continue
+        click.echo(f'{entry.name}  calls={stats.total_calls}  cpu={stats.total_tt:.3f}s')
+
+
+@profiles_cli.command('show')
+@click.argument('name')
+@click.option('--sort', default='cumulative', show_default=True, help='pstats sort key')
+@click.option('--limit', default=25, show_default=True, help='number of functions to print')
+def show_profile(name, sort, limit):
+    '''print the most expensive functions of a captured profile'''
+    path = os.path.join(_profile_dir(current_app), os.path.basename(name))
+    if not os.path.isfile(path):
+        raise click.ClickException(f'Profile {name} not found')
+    pstats.Stats(path).strip_dirs().sort_stats(sort).print_stats(limit)
+
+
+def init_app(app):
+    '''register profiling hooks and the "flask profiles" commands'''
+    app.before_request(_start_profile)
+    app.after_request(_stop_profile)
+    app.teardown_request(_discard_profile)
+    app.cli.add_command(profiles_cli)
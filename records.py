@@ -0,0 +1,251 @@
+'''
+    Read-only records for list endpoints
+    Lists select plain columns with Core and map each row into a small
+    __slots__ record instead of hydrating ORM objects (identity map, change
+    tracking, relationship proxies) that are only turned into dicts. The daily
+    limit flags of a page are computed with one grouped query per database
+    instead of one sum per entry. The JSON is the same as Model.serialize().
+    entry_table/user_table build the same values column-wise for
+    ?format=columnar (see formats.py).
+    The statements are shared with the async app (aio/), which executes them
+    on its own session.
+'''
+from sqlalchemy import func, select
+import foods
+import sharding
+from models import db
+from models.archive import ArchivedDailyTotal, ArchivedEntry
+from models.entry import Entry
+from models.user import User
+
+
+class EntryRow:
+    __slots__ = ('id', 'date', 'time', 'food_id', 'calories', 'user_id')
+
+    def __init__(self, id, date, time, food_id, calories, user_id):
+        self.id = id
+        self.date = date
+        self.time = time
+        self.food_id = food_id
+        self.calories = calories
+        self.user_id = user_id
+
+    def serialize(self, is_calorie_intake_less_than_expected, text):
+        return {
+            'id': self.id,
+            'date': self.date.strftime('%Y-%m-%d'),
+            'time': self.time.strftime('%H:%M:%S'),
+            'text': text,
+            'calories': self.calories,
+            'is_calorie_intake_less_than_expected': is_calorie_intake_less_than_expected,
+            'user_id': self.user_id
+        }
+
+
+class UserRow:
+    __slots__ = ('id', 'name', 'email', 'role', 'expected_daily_calories')
+
+    def __init__(self, id, name, email, role, expected_daily_calories):
+        self.id = id
+        self.name = name
+        self.email = email
+        self.role = role
+        self.expected_daily_calories = expected_daily_calories
+
+    def serialize(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'email': self.email,
+            'role': self.role,
+            'expected_daily_calories': self.expected_daily_calories
+        }
+
+
+def entry_columns(source=Entry):
+    '''columns of EntryRow, from Entry or an entity aliased over it (models.archive.entry_source)'''
+    return [source.id, source.date, source.time, source.food_id, source.calories, source.user_id]
+
+
+def user_columns():
+    return [User.id, User.name, User.email, User.role, User.expected_daily_calories]
+
+
+def filter_dates(statement, source, start_date, end_date):
+    if start_date:
+        statement = statement.filter(source.date >= start_date)
+    if end_date:
+        statement = statement.filter(source.date <= end_date)
+    return statement
+
+
+def entries_statement(source, current_user, user_name=None, food=None, start_date=None, end_date=None):
+    '''
+        rows of GET /entries in one database: source is Entry or the union with the
+        archive (models.archive.entry_source), which is ordered by id as it has no
+        natural order; admins see every user's entries, other roles their own
+    '''
+    statement = filter_dates(select(*entry_columns(source)), source, start_date, end_date)
+    if source is not Entry:
+        statement = statement.order_by(source.id)
+    if current_user.role != 'admin':
+        statement = statement.filter(source.user_id == current_user.id)
+    if user_name:
+        statement = statement.join(User, User.id == source.user_id).filter(User.name.ilike(f'%{user_name}%'))
+    if food:
+        statement = statement.filter(source.food_id.in_(foods.matching_statement(food)))
+    return statement
+
+
+def entries_by_id(ids):
+    '''rows of the given entries, hot or archived (upserts of the change feed)'''
+    return db.union_all(
+        select(*entry_columns()).where(Entry.id.in_(ids)),
+        select(*entry_columns(ArchivedEntry)).where(ArchivedEntry.id.in_(ids))
+    )
+
+
+def users_statement(username=None, email=None, role=None):
+    '''rows of GET /users/list'''
+    statement = select(*user_columns())
+    if username:
+        statement = statement.filter(User.name.ilike(f'%{username}%'))
+    if email:
+        statement = statement.filter(User.email.ilike(f'%{email}%'))
+    if role:
+        statement = statement.filter(User.role.ilike(f'%{role}%'))
+    return statement
+
+
+def daily_total_statements(pairs):
+    '''(hot, archived) selects of (user_id, date, calories) of the given pairs, see add_daily_totals'''
+    user_ids = {user_id for user_id, _ in pairs}
+    dates = {day for _, day in pairs}
+    hot = (
+        select(Entry.user_id, Entry.date, func.coalesce(func.sum(Entry.calories), 0))
+        .where(Entry.user_id.in_(user_ids), Entry.date.in_(dates))
+        .group_by(Entry.user_id, Entry.date)
+    )
+    archived = (
+        select(ArchivedDailyTotal.user_id, ArchivedDailyTotal.date, ArchivedDailyTotal.calories)
+        .where(ArchivedDailyTotal.user_id.in_(user_ids), ArchivedDailyTotal.date.in_(dates))
+    )
+    return hot, archived
+
+
+def add_daily_totals(*results):
+    '''{(user_id, date): calories} summed over the results of daily_total_statements'''
+    totals = {}
+    for rows in results:
+        for user_id, day, calories in rows:
+            totals[(user_id, day)] = totals.get((user_id, day), 0) + calories
+    return totals
+
+
+def daily_totals(session, pairs):
+    '''{(user_id, date): calories} of the given pairs, hot entries plus archived totals'''
+    return add_daily_totals(*(session.execute(statement) for statement in daily_total_statements(pairs)))
+
+
+def expected_statement(user_ids):
+    return select(User.id, User.expected_daily_calories).where(User.id.in_(set(user_ids)))
+
+
+def limit_flags(user_ids, dates, calories, food_ids):
+    '''
+        is_calorie_intake_less_than_expected of entries given column-wise, like the
+        Entry property: an entry without calories adds the calories of its food (looked
+        up, not saved) to its own day's total while calories stays null; for the other
+        entries of the day it counts as 0, whatever else is on the page
+    '''
+    # daily totals live with the entries, in the user's shard when sharded
+    pairs_by_shard = {}
+    for user_id, day in zip(user_ids, dates):
+        shard = sharding.shard_for(user_id) if sharding.enabled() else 0
+        pairs_by_shard.setdefault(shard, set()).add((user_id, day))
+    totals = {}
+    for pairs in pairs_by_shard.values():
+        user_id = next(iter(pairs))[0]
+        totals.update(daily_totals(sharding.session_for(user_id), pairs))
+
+    # looked up once per food of the page
+    looked_up = {}
+    for value, food_id in zip(calories, food_ids):
+        if value is None and food_id not in looked_up:
+            looked_up[food_id] = foods.calories_of(food_id) or 0
+    own = [looked_up[food_id] if value is None else 0 for value, food_id in zip(calories, food_ids)]
+
+    expected = dict(db.session.execute(expected_statement(user_ids)).all())
+    return flags(user_ids, dates, own, totals, expected)
+
+
+def flags(user_ids, dates, own, totals, expected):
+    '''limit flags from the daily totals, own is what each entry adds to its own total (see limit_flags)'''
+    return [
+        totals.get((user_id, day), 0) + extra <= expected[user_id]
+        for user_id, day, extra in zip(user_ids, dates, own)
+    ]
+
+
+def serialize_entries(rows):
+    '''serialize entry rows like Entry.serialize'''
+    records = [EntryRow(*row) for row in rows]
+    if not records:
+        return []
+    texts = foods.load({record.food_id for record in records})
+    flags = limit_flags(
+        [record.user_id for record in records], [record.date for record in records],
+        [record.calories for record in records], [record.food_id for record in records]
+    )
+    return [record.serialize(flag, texts[record.food_id]) for record, flag in zip(records, flags)]
+
+
+def serialize_users(rows):
+    return [UserRow(*row).serialize() for row in rows]
+
+
+def _columns(rows, fields):
+    '''transpose rows into {field: [values]}'''
+    if not rows:
+        return {field: [] for field in fields}
+    return dict(zip(fields, (list(column) for column in zip(*rows))))
+
+
+def _formatted(values, format):
+    '''strftime once per distinct value of a column'''
+    text = {value: value.strftime(format) for value in set(values)}
+    return [text[value] for value in values]
+
+
+def entry_values(entry):
+    '''row of an Entry/ArchivedEntry object, in the order of entry_columns'''
+    return tuple(getattr(entry, field) for field in EntryRow.__slots__)
+
+
+def user_values(user):
+    '''row of a User object, in the order of user_columns'''
+    return tuple(getattr(user, field) for field in UserRow.__slots__)
+
+
+def entry_table(rows, flags=None, texts=None):
+    '''
+        entry rows column-wise ({field: [values]}, for ?format=columnar) with the fields
+        and values of serialize_entries; flags are computed with limit_flags and the
+        {food_id: text} with foods.load when not given
+    '''
+    columns = _columns(rows, EntryRow.__slots__)
+    food_ids = columns.pop('food_id')
+    if texts is None:
+        texts = foods.load(set(food_ids))
+    if flags is None:
+        flags = limit_flags(columns['user_id'], columns['date'], columns['calories'], food_ids) if rows else []
+    columns['date'] = _formatted(columns['date'], '%Y-%m-%d')
+    columns['time'] = _formatted(columns['time'], '%H:%M:%S')
+    columns['text'] = [texts[food_id] for food_id in food_ids]
+    columns['is_calorie_intake_less_than_expected'] = list(flags)
+    return columns
+
+
+def user_table(rows):
+    '''user rows column-wise, like serialize_users'''
+    return _columns(rows, UserRow.__slots__)
@@ -3,7 +3,9 @@ from flask import Blueprint
 auth_bp = Blueprint('auth', __name__)
 entry_bp = Blueprint('entry_bp', __name__)
 users_bp = Blueprint('users', __name__, url_prefix='/users')
+metrics_bp = Blueprint('metrics', __name__)
 
 from .auth import *
 from .entry import *
 from .user import *
+from .metrics import *
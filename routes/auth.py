@@ -91,6 +91,11 @@ def generate_access_token(user):
     access_token = jwt.encode(payload, secret_key, algorithm='HS256')
     return access_token
 
+def decode_access_token(access_token):
+    '''verify and decode access token, raises jwt.InvalidTokenError'''
+    secret_key = current_app.config['SECRET_KEY']
+    return jwt.decode(access_token, secret_key, algorithms=['HS256'])
+
 
 # Decorator to check if the request is from an authenticated user
 def login_required(func):
@@ -104,8 +109,7 @@ def login_required(func):
 
         try:
             # Verify and decode the access token
-            secret_key = current_app.config['SECRET_KEY']
-            payload = jwt.decode(access_token, secret_key, algorithms=['HS256'])
+            payload = decode_access_token(access_token)
             user_id = payload.get('user_id')
 
             # Set the current user based on the user ID
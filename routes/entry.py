@@ -1,12 +1,21 @@
 '''
     Routes related to entries
 '''
-from flask import Blueprint, request, jsonify, g
+from flask import Blueprint, request, jsonify, g, abort
 from models.entry import Entry
 from models.user import User
+from models import entry_change
+from models import archive
+from models.archive import ArchivedEntry
+from models import db
 from .auth import auth_bp, login_required, admin_required, manager_required
 import requests
 from datetime import date, datetime
+import sharding
+from pagination import Page, paginate
+import records
+import foods
+import formats
 
 # Create a blueprint for entry routes
 entry_bp = Blueprint("entry_bp", __name__)
@@ -16,6 +25,10 @@ entry_bp = Blueprint("entry_bp", __name__)
     API to get all entries if admin access else their own records only
     arguments can be used to filter like
     Example - http://localhost:5000/entries?per_page=2&user_name=manager1&page=2
+    start_date/end_date (YYYY-MM-DD) limit the dates, archived entries are only
+    read when start_date is missing or not after the newest archived day
+    ?format=columnar returns one array per field, Accept: application/msgpack
+    returns MessagePack (see formats.py)
     method: GET
 '''
 @entry_bp.route("/entries", methods=["GET"])
@@ -27,31 +40,154 @@ def get_entries():
     per_page = request.args.get("per_page", default=10, type=int)
     user_name = request.args.get("username")
     food = request.args.get("food")
+    start_date = request.args.get("start_date", type=date.fromisoformat)
+    end_date = request.args.get("end_date", type=date.fromisoformat)
+    if formats.shape(request.args) is None:
+        return jsonify(formats.invalid_format_message()), 400
 
-    query = Entry.query
+    if sharding.enabled():
+        entries = _sharded_entries(current_user, page, per_page, user_name, food, start_date, end_date)
+        return _entries_response(entries)
 
-    if current_user.role == "admin":
-        if user_name:
-            query = query.join(User).filter(User.name.ilike(f"%{user_name}%"))
-        if food:
-            query = query.filter(Entry.text.ilike(f"%{food}%"))
-        entries = query.paginate(page=page, per_page=per_page)
+    horizon = db.session.execute(archive.horizon_statement()).scalar()
+    source = archive.entry_source(archive.needs_archive(horizon, start_date))
+    query = records.entries_statement(source, current_user, user_name, food, start_date, end_date)
+    entries = paginate(db.session, query, page, per_page)
+
+    return _entries_response(entries)
+
+def _entries_response(entries):
+    '''serialize a page of entry rows, in the format the request asks for'''
+    if formats.columnar(request.args):
+        result = records.entry_table(entries.items)
     else:
-        query = query.filter_by(user_id=current_user.id)
-        if user_name:
-            query = query.join(User).filter(User.name.ilike(f"%{user_name}%"))
-        if food:
-            query = query.filter(Entry.text.ilike(f"%{food}%"))
-        entries = query.paginate(page=page, per_page=per_page)
-
-    result = [entry.serialize() for entry in entries.items]
-    return jsonify({
+        result = records.serialize_entries(entries.items)
+    return formats.response({
         "entries": result,
         "total_entries": entries.total,
         "current_page": entries.page,
         "per_page": entries.per_page,
         "has_next": entries.has_next,
         "has_prev": entries.has_prev
+    }, request)
+
+def _sharded_entries(current_user, page, per_page, user_name, food, start_date, end_date):
+    '''
+        GET /entries over shards: user filters are resolved in the main database,
+        then every shard involved returns its count and first page*per_page entries
+        by id in parallel, and the pages are merged
+    '''
+    if page < 1 or per_page < 1:
+        abort(404)
+
+    user_ids = None
+    if user_name:
+        user_ids = [user_id for user_id, in User.query.filter(User.name.ilike(f"%{user_name}%")).with_entities(User.id)]
+    if current_user.role != "admin":
+        user_ids = [current_user.id] if user_ids is None or current_user.id in user_ids else []
+
+    # foods live in the main database, shards are filtered by id
+    food_ids = db.session.execute(foods.matching_statement(food)).scalars().all() if food else None
+
+    shards = None
+    if user_ids is not None:
+        shards = sorted({sharding.shard_for(user_id) for user_id in user_ids})
+
+    def query_shard(session, shard):
+        horizon = session.execute(archive.horizon_statement()).scalar()
+        source = archive.entry_source(archive.needs_archive(horizon, start_date))
+        query = records.filter_dates(db.select(*records.entry_columns(source)), source, start_date, end_date)
+        if user_ids is not None:
+            query = query.filter(source.user_id.in_(user_ids))
+        if food_ids is not None:
+            query = query.filter(source.food_id.in_(food_ids))
+        total = session.execute(db.select(db.func.count()).select_from(query.order_by(None).subquery())).scalar()
+        return total, session.execute(query.order_by(source.id).limit(page * per_page)).all()
+
+    results = sharding.fan_out(query_shard, shards)
+    merged = sharding.merge_by_id([items for _, items in results], page * per_page)
+    items = merged[(page - 1) * per_page:]
+    if not items and page != 1:
+        abort(404)
+    return Page(items, sum(total for total, _ in results), page, per_page)
+
+def _find_entry(current_user, entry_id, restore=False):
+    '''
+        admins can reach any entry, other roles only their own; archived entries
+        are returned read only, or moved back into entries first when restore is set
+    '''
+    if current_user.role == 'regular' or current_user.role == 'manager':
+        sessions = [sharding.session_for(current_user.id)]
+    else:
+        sessions = sharding.all_sessions()
+    for model in (Entry, ArchivedEntry):
+        for session in sessions:
+            entry = session.get(model, entry_id)
+            if entry and (current_user.role == 'admin' or entry.user_id == current_user.id):
+                if model is ArchivedEntry and restore:
+                    return _restore(session, entry)
+                return entry
+    return None
+
+def _restore(session, archived):
+    '''move an archived entry back into entries, so it can be changed like any other'''
+    entry_id = archived.id
+    for statement in archive.restore_statements(archived):
+        session.execute(statement)
+    session.commit()
+    session.expunge(archived)
+    return session.get(Entry, entry_id)
+
+'''
+    API: http://localhost:5000/entries/changes?since=0&limit=100
+    API to sync entries incrementally: inserts/updates ("upsert", with the entry)
+    and deletes ("delete") after the since cursor, oldest first, only of entries the
+    caller can see. Pass next_since of the response as since of the next call while
+    has_more is true; 410 means the cursor expired and the client has to start over
+    from since=0
+    method: GET
+'''
+@entry_bp.route("/entries/changes", methods=["GET"])
+@login_required
+def get_entry_changes():
+    """Get the changes of entries since a cursor."""
+    current_user = g.current_user
+    limit = min(request.args.get("limit", default=100, type=int), 1000)
+    parts = max(sharding.shard_count(), 1)
+    cursor = entry_change.parse_cursor(request.args.get("since"), parts)
+    if cursor is None or limit < 1:
+        return jsonify({"message": "Invalid since or limit"}), 400
+    if len(cursor) != parts:
+        return jsonify({"message": "Sync cursor expired, sync again from since=0"}), 410
+
+    user_id = None if current_user.role == "admin" else current_user.id
+
+    def query_shard(session, shard):
+        since = cursor[shard]
+        reset = session.execute(entry_change.reset_statement()).scalar() or 0
+        if 0 < since < reset:
+            return None
+        rows = session.execute(entry_change.feed_statement(since, user_id, limit + 1)).scalars().all()
+        ids = [row.entry_id for row in rows[:limit] if row.op == 'upsert']
+        entries = session.execute(records.entries_by_id(ids)).all() if ids else []
+        return rows, entries
+
+    if sharding.enabled():
+        shards = list(range(parts)) if user_id is None else [sharding.shard_for(user_id)]
+        results = dict(zip(shards, sharding.fan_out(query_shard, shards)))
+    else:
+        results = {0: query_shard(db.session, 0)}
+    if any(result is None for result in results.values()):
+        return jsonify({"message": "Sync cursor expired, sync again from since=0"}), 410
+
+    feeds = {shard: rows for shard, (rows, _) in results.items()}
+    changes, cursor, has_more = entry_change.merge_feeds(feeds, cursor, limit)
+    rows = [row for _, found in results.values() for row in found]
+    entries = dict(zip([row.id for row in rows], records.serialize_entries(rows)))
+    return jsonify({
+        "changes": entry_change.serialize_changes(changes, entries),
+        "next_since": entry_change.format_cursor(cursor),
+        "has_more": has_more
     })
 
 '''
@@ -64,15 +200,7 @@ def get_entries():
 @login_required
 def get_entry(entry_id):
     """Get a specific entry."""
-    current_user = g.current_user
-
-    if current_user.role == 'regular' or current_user.role == 'manager':
-        entry = Entry.query.filter_by(user_id=current_user.id).filter_by(id=entry_id).first()
-        if not entry:
-            return jsonify({"message": "Entry not found"}), 404
-        return jsonify(entry.serialize())
-
-    entry = Entry.query.get(entry_id)
+    entry = _find_entry(g.current_user, entry_id)
     if not entry:
         return jsonify({"message": "Entry not found"}), 404
 
@@ -142,13 +270,7 @@ def create_entry():
 @login_required
 def update_entry(entry_id):
     """Update a specific entry."""
-    current_user = g.current_user
-
-    if current_user.role == 'regular' or current_user.role == 'manager':
-        entry = Entry.query.filter_by(user_id=current_user.id).filter_by(id=entry_id).first()
-    elif current_user.role == 'admin':
-        entry = Entry.query.get(entry_id)
-
+    entry = _find_entry(g.current_user, entry_id, restore=True)
     if not entry:
         return jsonify({"message": "Entry not found"}), 404
 
@@ -164,11 +286,18 @@ def update_entry(entry_id):
     if time_str is None:
         time_str =  datetime.now().time()
 
+    # the food and its calories are resolved before the entry changes, so the
+    # calories stored on the food are not written while the entry holds the lock
+    food_id = foods.intern(data["text"]) if "text" in data else entry.food_id
+    calories = data.get("calories")
+    if calories is None:
+        calories = foods.calories_of(food_id)
+
     # Update the entry with the validated date and time
     entry.date = date_str
     entry.time = time_str
-    entry.text = data.get("text", entry.text)
-    entry.calories = data.get("calories")
+    entry.food_id = food_id
+    entry.calories = calories
     entry.save()
 
     return jsonify(entry.serialize())
@@ -183,12 +312,7 @@ def update_entry(entry_id):
 @login_required
 def delete_entry(entry_id):
     """Delete a specific entry."""
-    current_user = g.current_user
-    if current_user.role == 'regular' or current_user.role == 'manager':
-        entry = Entry.query.filter_by(user_id=current_user.id).filter_by(id=entry_id).first()
-    elif current_user.role == 'admin':
-        entry = Entry.query.get(entry_id)
-
+    entry = _find_entry(g.current_user, entry_id, restore=True)
     if not entry:
         return jsonify({"message": "Entry not found"}), 404
 
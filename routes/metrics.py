@@ -0,0 +1,20 @@
+'''
+    Routes related to monitoring
+'''
+from flask import Blueprint, Response
+import metrics
+
+# Create blueprint for metrics routes
+metrics_bp = Blueprint('metrics', __name__)
+
+'''
+    API: http://localhost:5000/metrics
+    Prometheus scrape endpoint, not authenticated so it should only be
+    reachable from the monitoring network
+    method: GET
+'''
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Expose metrics in the Prometheus text format."""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
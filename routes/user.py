@@ -4,6 +4,10 @@
 from flask import Blueprint, request, jsonify, g, abort
 from werkzeug.security import generate_password_hash
 from models.user import User
+from models import db
+from pagination import paginate
+import records
+import formats
 import requests
 from .auth import auth_bp, login_required, admin_required, manager_required
 
@@ -78,6 +82,7 @@ def get_user(user_id):
     API to get a list of all users, access to manager and admin
     arguments can be used to filter with role,username,email
     Example - http://localhost:5000/users/list?role=regular&username=user4
+    ?format=columnar and Accept: application/msgpack work as for /entries
     method: GET
 '''
 @users_bp.route('/list', methods=['GET'])
@@ -93,21 +98,16 @@ def get_users():
     username = request.args.get('username')
     email = request.args.get('email')
     user_role = request.args.get('role')
-    query = User.query
-
-    if username:
-        query = query.filter(User.name.ilike(f'%{username}%'))
-
-    if email:
-        query = query.filter(User.email.ilike(f'%{email}%'))
-
-    if user_role:
-        query = query.filter(User.role.ilike(f'%{user_role}%'))
-
-    users = query.paginate(page=page, per_page=per_page)
-
-    serialized_users = [users.serialize() for users in users.items]
-    return jsonify({
+    if formats.shape(request.args) is None:
+        return jsonify(formats.invalid_format_message()), 400
+    query = records.users_statement(username, email, user_role)
+    users = paginate(db.session, query, page, per_page)
+
+    if formats.columnar(request.args):
+        serialized_users = records.user_table(users.items)
+    else:
+        serialized_users = records.serialize_users(users.items)
+    return formats.response({
         'users': serialized_users,
         'total_users': users.total,
         'current_page': users.page,
@@ -115,7 +115,7 @@ def get_users():
         'total_pages': users.pages,
         'has_next': users.has_next,
         'has_prev': users.has_prev
-    })
+    }, request)
 
 
 '''
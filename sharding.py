@@ -0,0 +1,309 @@
+'''
+    Optional per-user sharding of entries across SQLite files
+    SQLite allows one writer per file, so with a single database every entry
+    commit of every user waits on the same lock. In sharded mode the entries
+    of a user (and with them the user's daily totals) live in one of N files,
+    instance/shards/entries_<n>.db, chosen by a hash of user_id; users stay in
+    the main database, which acts as the directory.
+
+    The layout is recorded in instance/shards/manifest.json (SHARD_DIR, which a
+    server on another database has to point elsewhere) and only changes
+    through "flask shards reshard <N>" (0 moves everything back to the main
+    database). Run it with the API stopped and restart the workers afterwards.
+
+    Entry ids stay unique across shards: ids created in shard s are
+    congruent to s modulo ID_STRIDE and are above the largest id that existed
+    when the shards were laid out.
+'''
+import heapq
+import json
+import os
+import shutil
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import click
+import sqlalchemy as sa
+from flask import current_app
+from flask.globals import app_ctx
+from flask.cli import AppGroup
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+from models import db
+
+shards_cli = AppGroup('shards', help='Manage per-user entry shards.')
+
+'''upper bound on the number of shards, part of the entry id scheme'''
+ID_STRIDE = 1024
+'''tables partitioned by user_id, created in every shard file'''
+SHARD_TABLES = ['entries', 'archived_entries', 'archived_daily_totals']
+'''tables each shard file keeps for itself (filled by triggers), not copied on reshard'''
+LOCAL_TABLES = ['entry_changes']
+
+shard_metadata = sa.MetaData()
+shard_meta = sa.Table(
+    'shard_meta', shard_metadata,
+    sa.Column('key', sa.String(50), primary_key=True),
+    sa.Column('value', sa.Integer, nullable=False)
+)
+
+
+class ShardState:
+    '''engines and request scoped sessions of the shards of one app'''
+    def __init__(self, directory, count):
+        self.directory = directory
+        self.count = count
+        self.engines = [
+            sa.create_engine('sqlite:///' + shard_path(directory, index)) for index in range(count)
+        ]
+        self.sessions = [
+            scoped_session(sessionmaker(bind=engine), scopefunc=_context_id) for engine in self.engines
+        ]
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    def executor(self):
+        '''thread pool for fan-out queries, recreated after fork'''
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=max(self.count, 1), thread_name_prefix='shard')
+                self._executor_pid = os.getpid()
+        return self._executor
+
+
+def _context_id():
+    '''sessions are scoped to the app context, like db.session'''
+    return id(app_ctx._get_current_object())
+
+
+def shard_directory(app):
+    return os.path.join(app.instance_path, app.config.get('SHARD_DIR', 'shards'))
+
+
+def shard_path(directory, index):
+    return os.path.join(directory, f'entries_{index}.db')
+
+
+def read_shard_count(directory):
+    '''number of shards recorded in the manifest, 0 when the main database holds the entries'''
+    try:
+        with open(os.path.join(directory, 'manifest.json')) as manifest:
+            return json.load(manifest)['shards']
+    except FileNotFoundError:
+        return 0
+
+
+def _state():
+    return current_app.extensions['entry_shards']
+
+
+def enabled():
+    return _state().count > 0
+
+
+def shard_count():
+    return _state().count
+
+
+def _shard_of(user_id, count):
+    return zlib.crc32(str(int(user_id)).encode()) % count
+
+
+def shard_for(user_id):
+    '''shard index of a user, stable across processes and restarts'''
+    return _shard_of(user_id, _state().count)
+
+
+def session_for(user_id):
+    '''session holding the entries of a user'''
+    state = _state()
+    if not state.count:
+        return db.session
+    return state.sessions[shard_for(user_id)]()
+
+
+def engines():
+    '''engines of the shards, empty when the main database holds the entries'''
+    return list(_state().engines)
+
+
+def all_sessions():
+    state = _state()
+    if not state.count:
+        return [db.session]
+    return [session() for session in state.sessions]
+
+
+def fan_out(func, shards=None):
+    '''
+        run func(session, shard) on the given shards (default all) in parallel,
+        each call gets its own short lived session; returns the results in shard order
+    '''
+    state = _state()
+    shards = range(state.count) if shards is None else shards
+
+    def run(shard):
+        with Session(state.engines[shard]) as session:
+            return func(session, shard)
+
+    return list(state.executor().map(run, shards))
+
+
+def merge_by_id(results, limit):
+    '''merge per-shard lists already sorted by id'''
+    merged = heapq.merge(*results, key=lambda row: row.id)
+    return [row for _, row in zip(range(limit), merged)]
+
+
+def next_id(user_id):
+    '''
+        SQL expression for the id of a new entry in the user's shard, evaluated inside the
+        INSERT so concurrent writers of the same shard cannot pick the same id; above every
+        id the shard ever had (deleted and archived entries included)
+    '''
+    # models.entry imports this module
+    from models.archive import highest_entry_id
+    shard = shard_for(user_id)
+    floor = sa.select(shard_meta.c.value).where(shard_meta.c.key == 'id_floor').scalar_subquery()
+    highest = sa.func.max(highest_entry_id(), sa.func.coalesce(floor, 0))
+    return sa.select((highest // ID_STRIDE + 1) * ID_STRIDE + shard).scalar_subquery()
+
+
+def delete_user_rows(user_id):
+    '''remove everything of a deleted user from its shard'''
+    session = session_for(user_id)
+    for name in SHARD_TABLES:
+        table = db.metadata.tables[name]
+        session.execute(table.delete().where(table.c.user_id == user_id))
+    session.commit()
+
+
+def _remove_sessions(exception=None):
+    state = current_app.extensions.get('entry_shards')
+    if state is not None:
+        for session in state.sessions:
+            session.remove()
+
+
+def dispose_engines(app):
+    '''drop pooled connections inherited over fork'''
+    for engine in app.extensions['entry_shards'].engines:
+        engine.dispose(close=False)
+
+
+def init_app(app):
+    directory = shard_directory(app)
+    app.extensions['entry_shards'] = ShardState(directory, read_shard_count(directory))
+    app.teardown_appcontext(_remove_sessions)
+    app.cli.add_command(shards_cli)
+
+
+def _create_shard(path, floor):
+    engine = sa.create_engine('sqlite:///' + path)
+    db.metadata.create_all(engine, tables=[db.metadata.tables[name] for name in LOCAL_TABLES + SHARD_TABLES])
+    shard_metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(shard_meta.insert().values(key='id_floor', value=floor))
+    return engine
+
+
+def _copy_rows(sources, targets, batch):
+    '''stream every shard table from the sources into the target chosen by user_id'''
+    count = len(targets)
+    copied = 0
+    for name in SHARD_TABLES:
+        table = db.metadata.tables[name]
+        for source in sources:
+            with source.connect() as connection:
+                result = connection.execution_options(yield_per=batch).execute(sa.select(table).order_by(*table.primary_key.columns))
+                for rows in result.partitions():
+                    grouped = {}
+                    for row in rows:
+                        shard = _shard_of(row.user_id, count)
+                        grouped.setdefault(shard, []).append(row._asdict())
+                    for shard, values in grouped.items():
+                        with targets[shard].begin() as target:
+                            target.execute(table.insert(), values)
+                    copied += len(rows)
+    return copied
+
+
+@shards_cli.command('reshard')
+@click.argument('count', type=click.IntRange(0, ID_STRIDE))
+@click.option('--batch', default=5000, show_default=True, help='Rows copied per transaction.')
+def reshard(count, batch):
+    '''move all entries into COUNT shard files (0 = back into the main database)'''
+    state = _state()
+    if count == state.count:
+        raise click.ClickException(f'Entries are already in {count} shard(s)')
+
+    sources = state.engines or [db.engine]
+    tables = [db.metadata.tables[name] for name in SHARD_TABLES]
+    floor = 0
+    for source in sources:
+        with source.connect() as connection:
+            floor = max(floor, connection.execute(sa.select(sa.func.max(tables[0].c.id))).scalar() or 0)
+
+    directory = state.directory
+    staging = directory + '.new'
+    if count:
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        targets = [_create_shard(shard_path(staging, index), floor) for index in range(count)]
+    else:
+        with db.engine.connect() as connection:
+            if connection.execute(sa.select(sa.func.count()).select_from(tables[0])).scalar():
+                raise click.ClickException('The main database still has entries, cannot move shards into it')
+        targets = [db.engine]
+
+    # sync cursors taken before the move cannot be continued in the new layout
+    # (models.entry imports this module, so the models are imported here)
+    from models.archive import reserve_archived_ids
+    from models.entry_change import archived_upserts, reset_marker
+    changes = db.metadata.tables['entry_changes']
+    for target in targets:
+        with target.begin() as connection:
+            connection.execute(reset_marker())
+
+    copied = _copy_rows(sources, targets, batch)
+    # archived rows are copied around entries: new entries must not get their ids, and
+    # no trigger put them in the feed clients re-sync from after the reset
+    for target in targets:
+        with target.begin() as connection:
+            reserve_archived_ids(connection)
+            for statement in archived_upserts():
+                connection.execute(statement)
+
+    for engine in state.engines + (targets if count else []):
+        engine.dispose()
+    if not state.count:
+        # entries moved out of the main database
+        with db.engine.begin() as connection:
+            for table in reversed(tables):
+                connection.execute(table.delete())
+            # the tombstones written by the delete above describe the move, not user changes
+            connection.execute(changes.delete())
+    if os.path.isdir(directory):
+        os.rename(directory, f'{directory}.old-{int(time.time())}')
+    if count:
+        with open(os.path.join(staging, 'manifest.json'), 'w') as manifest:
+            json.dump({'shards': count, 'id_stride': ID_STRIDE}, manifest)
+        os.rename(staging, directory)
+
+    source = f'{state.count} shard(s)' if state.count else 'the main database'
+    target = f'{count} shard(s)' if count else 'the main database'
+    click.echo(f'Moved {copied} rows from {source} into {target}. Restart the API workers.')
+
+
+@shards_cli.command('status')
+def status():
+    '''entries per shard'''
+    state = _state()
+    table = db.metadata.tables['entries']
+    if not state.count:
+        click.echo(f'Not sharded: {db.session.query(sa.func.count()).select_from(table).scalar()} entries in the main database')
+        return
+    counts = fan_out(lambda session, shard: session.execute(sa.select(sa.func.count()).select_from(table)).scalar())
+    for index, rows in enumerate(counts):
+        click.echo(f'shard {index}: {rows} entries ({shard_path(state.directory, index)})')
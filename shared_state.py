@@ -0,0 +1,92 @@
+'''
+    State shared between worker processes
+    A small SQLite file (instance/shared_state.db, SHARED_STATE_FILE) holds a key/value
+    cache with expiry and fixed-window counters. Every process opens its own
+    connection after fork, WAL mode lets workers read while one writes.
+    The data is disposable: losing the file only costs cache misses.
+'''
+import json
+import os
+import sqlite3
+import threading
+import time
+
+_path = None
+_local = threading.local()
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS cache (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS counters (
+        key TEXT NOT NULL,
+        window_start INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (key, window_start)
+    );
+'''
+
+
+def configure(path):
+    '''set the store location; connections opened before this (or before fork) are dropped'''
+    global _path
+    _path = path
+    _local.__dict__.clear()
+
+
+def _connection():
+    connection = getattr(_local, 'connection', None)
+    if connection is not None and _local.pid == os.getpid():
+        return connection
+    if _path is None:
+        raise RuntimeError('shared_state.configure() has not been called')
+
+    os.makedirs(os.path.dirname(_path) or '.', exist_ok=True)
+    connection = sqlite3.connect(_path, timeout=5, isolation_level=None)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=OFF')
+    connection.executescript(SCHEMA)
+    _local.connection = connection
+    _local.pid = os.getpid()
+    return connection
+
+
+def get(key):
+    '''cached value for key, None when missing or expired'''
+    row = _connection().execute(
+        'SELECT value FROM cache WHERE key = ? AND expires_at > ?', (key, time.time())
+    ).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def put(key, value, ttl):
+    '''cache a JSON serializable value for ttl seconds'''
+    _connection().execute(
+        'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+        (key, json.dumps(value), time.time() + ttl)
+    )
+
+
+def incr(key, window):
+    '''count one event in the current fixed window of `window` seconds, returns the count so far'''
+    window_start = int(time.time() // window * window)
+    connection = _connection()
+    count = connection.execute(
+        'INSERT INTO counters (key, window_start, count) VALUES (?, ?, 1) '
+        'ON CONFLICT (key, window_start) DO UPDATE SET count = count + 1 RETURNING count',
+        (key, window_start)
+    ).fetchone()[0]
+    if count == 1:
+        # first hit of a new window, drop the windows before it
+        connection.execute('DELETE FROM counters WHERE key = ? AND window_start < ?', (key, window_start))
+    return count
+
+
+def purge_expired():
+    _connection().execute('DELETE FROM cache WHERE expires_at <= ?', (time.time(),))
+
+
+def init_app(app):
+    configure(os.path.join(app.instance_path, app.config.get('SHARED_STATE_FILE', 'shared_state.db')))
@@ -0,0 +1,79 @@
+import glob
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# everything the apps write goes to a temporary directory, never into instance/
+_workdir = tempfile.mkdtemp(prefix='calories-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_workdir, 'test.db')
+os.environ['SHARED_STATE_FILE'] = os.path.join(_workdir, 'shared_state.db')
+os.environ['SHARD_DIR'] = os.path.join(_workdir, 'shards')
+os.environ['NUTRITIONIX_API_URL'] = 'http://127.0.0.1:1/v2/natural/nutrients'
+os.environ.pop('GROUP_COMMIT', None)
+
+import pytest
+
+
+def _reset_caches():
+    import foods
+    import nutrition
+    import shared_state
+    shared_state._connection().executescript('DELETE FROM cache; DELETE FROM counters;')
+    foods.clear()
+    nutrition._index = None
+
+
+def _unshard(app):
+    import sharding
+    directory = sharding.shard_directory(app)
+    for engine in app.extensions['entry_shards'].engines:
+        engine.dispose()
+    app.extensions['entry_shards'] = sharding.ShardState(directory, 0)
+    for path in glob.glob(directory + '*'):
+        shutil.rmtree(path)
+
+
+@pytest.fixture
+def app():
+    from app import app
+    from models import db
+    app.config.update(TESTING=True, METRICS_ENABLED=False, GROUP_COMMIT=False,
+                      PROFILE_DIR=os.path.join(_workdir, 'profiles'))
+    _unshard(app)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    _reset_caches()
+    yield app
+    _unshard(app)
+    _reset_caches()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    '''register and log in a user, returns its Authorization header'''
+    def login(name, role='regular'):
+        client.post('/register', json={'name': name, 'email': f'{name}@test', 'password': 'secret', 'role': role})
+        response = client.post('/login', json={'email': f'{name}@test', 'password': 'secret'})
+        return {'Authorization': response.get_json()['access_token']}
+    return login
+
+
+@pytest.fixture
+def reshard(app):
+    '''move the entries into count shards (0: back into the main database), like a restart would pick up'''
+    import sharding
+
+    def reshard(count):
+        result = app.test_cli_runner().invoke(args=['shards', 'reshard', str(count)])
+        assert result.exit_code == 0, result.output
+        app.extensions['entry_shards'] = sharding.ShardState(sharding.shard_directory(app), count)
+    return reshard
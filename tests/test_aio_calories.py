@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import pytest
+from quart import g
+import aio.helpers
+from aio import create_app
+from models import db
+from models.food import Food
+
+
+@pytest.fixture
+def aio_app(app):
+    '''async app on the database of the (freshly created) Flask app'''
+    return create_app()
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    '''stubbed Nutritionix call, recording whether the request still held a transaction'''
+    calls = []
+    answers = {}
+
+    async def fetch(text):
+        calls.append((text, g.session.in_transaction()))
+        await asyncio.sleep(0)
+        return answers.get(text)
+
+    monkeypatch.setattr(aio.helpers, 'fetch_nutritionix_calories', fetch)
+    return calls, answers
+
+
+def run(aio_app, scenario):
+    async def main():
+        async with aio_app.test_app() as test_app:
+            client = test_app.test_client()
+            await client.post('/register', json={'name': 'a', 'email': 'a@test', 'password': 'secret', 'role': 'admin'})
+            response = await client.post('/login', json={'email': 'a@test', 'password': 'secret'})
+            headers = {'Authorization': (await response.get_json())['access_token']}
+            return await scenario(client, headers)
+    return asyncio.run(main())
+
+
+def test_no_transaction_while_waiting_on_the_provider(app, aio_app, provider):
+    calls, answers = provider
+    answers['zzq'] = 42
+
+    async def scenario(client, headers):
+        created = await client.post('/entries', json={'text': 'zzq'}, headers=headers)
+        updated = await client.put('/entries/1', json={'text': 'qqz'}, headers=headers)
+        return await created.get_json(), updated.status_code, await updated.get_json()
+
+    created, status, updated = run(aio_app, scenario)
+    assert created['calories'] == 42
+    assert status == 200 and updated['text'] == 'qqz' and updated['calories'] is None
+    assert {text for text, _ in calls} == {'zzq', 'qqz'}
+    assert not any(in_transaction for _, in_transaction in calls)
+
+
+def test_page_resolves_each_food_once(app, aio_app, provider):
+    calls, answers = provider
+
+    async def create(client, headers):
+        for text in ['zzq', 'qqz', 'zzq']:
+            await client.post('/entries', json={'text': text}, headers=headers)
+
+    run(aio_app, create)
+    calls.clear()
+    answers.update({'zzq': 5, 'qqz': 7})
+
+    async def listing(client, headers):
+        return await (await client.get('/entries', headers=headers)).get_json()
+
+    page = run(aio_app, listing)
+    assert [entry['calories'] for entry in page['entries']] == [None, None, None]
+    assert sorted(calls) == [('qqz', False), ('zzq', False)]
+    with app.app_context():
+        assert dict(db.session.execute(db.select(Food.text, Food.calories)).all()) == {'zzq': 5, 'qqz': 7}
+
+
+def test_shared_state_is_used_off_the_event_loop(app, aio_app, provider, monkeypatch):
+    calls, answers = provider
+    answers['zzq'] = 42
+    threads = []
+    for name in ('cached_nutritionix_calories', 'nutritionix_allowed', 'remember_nutritionix_calories'):
+        original = getattr(aio.helpers.nutrition, name)
+
+        def recording(*args, original=original, name=name):
+            threads.append((name, threading.current_thread() is threading.main_thread()))
+            return original(*args)
+        monkeypatch.setattr(aio.helpers.nutrition, name, recording)
+
+    async def scenario(client, headers):
+        return await (await client.post('/entries', json={'text': 'zzq'}, headers=headers)).get_json()
+
+    assert run(aio_app, scenario)['calories'] == 42
+    assert threads == [
+        ('cached_nutritionix_calories', False), ('nutritionix_allowed', False), ('remember_nutritionix_calories', False)
+    ]
@@ -0,0 +1,54 @@
+import asyncio
+from datetime import date, time, timedelta
+import pytest
+from aio import create_app
+from models.entry import Entry
+
+URLS = [
+    '/entries?per_page=100',
+    '/entries?per_page=2&page=2',
+    f'/entries?start_date={date.today().isoformat()}',
+    '/entries?food=egg&username=adm',
+    '/entries?format=columnar',
+    '/entries/changes?since=0',
+    '/entries/changes?since=1&limit=2',
+    '/users/list?per_page=5',
+    '/users/list?role=regular&format=columnar',
+]
+
+
+@pytest.fixture
+def entries(app, client, login):
+    '''hot and archived entries of two users, created through the Flask app'''
+    admin, regular = login('admin', 'admin'), login('reg')
+    with app.app_context():
+        for days, text, calories, user_id in [(400, 'egg', 100, 1), (400, 'rice', None, 1), (0, 'egg', 50, 1),
+                                              (0, 'tea', None, 2), (0, 'Egg', 30, 2)]:
+            Entry(date=date.today() - timedelta(days=days), time=time(9), text=text, calories=calories, user_id=user_id).save()
+    result = app.test_cli_runner().invoke(args=['archive', 'run', '--days', '30'])
+    assert result.exit_code == 0, result.output
+    return admin, regular
+
+
+def _aio_get(headers):
+    async def main():
+        aio_app = create_app()
+        async with aio_app.test_app() as test_app:
+            client = test_app.test_client()
+            responses = []
+            for url in URLS:
+                response = await client.get(url, headers=headers)
+                responses.append((response.status_code, await response.get_json()))
+            return responses
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize('user', ['admin', 'regular'])
+def test_async_lists_match_the_flask_app(client, entries, user):
+    headers = entries[0] if user == 'admin' else entries[1]
+    expected = []
+    for url in URLS:
+        response = client.get(url, headers=headers)
+        expected.append((response.status_code, response.get_json()))
+    assert _aio_get(headers) == expected
+    assert expected[0][0] == 200 and expected[-1][0] == (200 if user == 'admin' else 401)
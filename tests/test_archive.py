@@ -0,0 +1,102 @@
+from datetime import date, time, timedelta
+import sharding
+from models.entry import Entry
+
+OLD = date.today() - timedelta(days=400)
+
+
+def _add_entries(app, user_id, dates):
+    '''entries through the ORM (POST /entries does not take a date), returns their ids'''
+    ids = []
+    with app.app_context():
+        for day in dates:
+            entry = Entry(date=day, time=time(12), text='egg', calories=100, user_id=user_id)
+            entry.save()
+            ids.append(entry.id)
+    return ids
+
+
+def _archive(app):
+    result = app.test_cli_runner().invoke(args=['archive', 'run', '--days', '30'])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def _feed(client, headers):
+    changes = client.get('/entries/changes?since=0&limit=1000', headers=headers).get_json()['changes']
+    return sorted((change['entry_id'], change['op']) for change in changes)
+
+
+def test_new_entries_do_not_reuse_archived_ids(app, client, login):
+    headers = login('admin', 'admin')
+    assert _add_entries(app, 1, [OLD, OLD, date.today()]) == [1, 2, 3]
+    assert 'archived 2 entries' in _archive(app)
+
+    assert client.delete('/entries/3', headers=headers).status_code == 200
+    created = client.post('/entries', json={'text': 'rice', 'calories': 200}, headers=headers).get_json()
+    assert created['id'] == 4
+
+    listed = client.get('/entries?per_page=100', headers=headers).get_json()['entries']
+    assert [entry['id'] for entry in listed] == [1, 2, 4]
+    assert [entry['text'] for entry in listed] == ['egg', 'egg', 'rice']
+    assert _feed(client, headers) == [(1, 'upsert'), (2, 'upsert'), (3, 'delete'), (4, 'upsert')]
+
+    # archived entries can still be moved back
+    restored = client.put('/entries/1', json={'calories': 50}, headers=headers)
+    assert restored.status_code == 200 and restored.get_json()['id'] == 1
+
+
+def test_ids_are_not_reused_when_everything_is_archived(app, client, login):
+    headers = login('admin', 'admin')
+    _add_entries(app, 1, [OLD, OLD])
+    assert 'archived 2 entries' in _archive(app)
+    assert _add_entries(app, 1, [date.today()]) == [3]
+    assert _feed(client, headers) == [(1, 'upsert'), (2, 'upsert'), (3, 'upsert')]
+
+
+def test_sharded_ids_are_not_reused(app, client, login, reshard):
+    headers = login('admin', 'admin')
+    _add_entries(app, 1, [date.today()])
+    reshard(2)
+    with app.app_context():
+        shard = sharding.shard_for(1)
+    first, second = _add_entries(app, 1, [OLD, date.today()])
+    assert first % sharding.ID_STRIDE == shard and second > first
+
+    assert 'archived 1 entries' in _archive(app)
+    assert client.delete(f'/entries/{second}', headers=headers).status_code == 200
+    assert client.delete('/entries/1', headers=headers).status_code == 200
+    (third,) = _add_entries(app, 1, [date.today()])
+    assert third > second and third % sharding.ID_STRIDE == shard
+
+    listed = client.get('/entries?per_page=100', headers=headers).get_json()['entries']
+    assert [entry['id'] for entry in listed] == [first, third]
+
+
+def test_merging_shards_keeps_archived_ids_reserved(app, client, login, reshard):
+    headers = login('admin', 'admin')
+    reshard(2)
+    (archived,) = _add_entries(app, 1, [OLD])
+    _archive(app)
+    reshard(0)
+
+    # the archived id was only ever in the shard's entries table
+    (created,) = _add_entries(app, 1, [date.today()])
+    assert created > archived
+    listed = client.get('/entries?per_page=100', headers=headers).get_json()['entries']
+    assert [entry['id'] for entry in listed] == [archived, created]
+
+
+def test_archived_entries_stay_in_the_feed_after_a_reshard(app, client, login, reshard):
+    headers = login('admin', 'admin')
+    _add_entries(app, 1, [OLD, date.today()])
+    _archive(app)
+    before = _feed(client, headers)
+    assert before == [(1, 'upsert'), (2, 'upsert')]
+
+    for count in (2, 0):
+        reshard(count)
+        assert client.get('/entries/changes?since=1', headers=headers).status_code == 410
+        assert _feed(client, headers) == before, count
+        listed = client.get('/entries?per_page=100', headers=headers).get_json()['entries']
+        assert [entry['id'] for entry in listed] == [1, 2]
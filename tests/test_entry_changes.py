@@ -0,0 +1,146 @@
+import pytest
+import sharding
+
+# with 2 shards users 1-3 are in shard 1 and users 4-6 in shard 0
+
+
+@pytest.fixture
+def users(login):
+    '''an admin (id 1) and three regular users (ids 2 to 4), as Authorization headers'''
+    return [login('admin', 'admin'), login('a'), login('b'), login('c')]
+
+
+def _post(client, headers, count=1):
+    return [client.post('/entries', json={'text': 'egg', 'calories': 80}, headers=headers).get_json()['id']
+            for _ in range(count)]
+
+
+def _changes(client, headers, since=0, limit=100):
+    response = client.get(f'/entries/changes?since={since}&limit={limit}', headers=headers)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def _sync(client, headers, limit):
+    '''every page from since=0, returns the pages'''
+    pages, since = [], 0
+    while True:
+        page = _changes(client, headers, since, limit)
+        pages.append(page)
+        since = page['next_since']
+        if not page['has_more']:
+            return pages
+
+
+def _ops(changes):
+    return [(change['entry_id'], change['op']) for change in changes]
+
+
+def test_cursor_of_the_main_database(client, users):
+    ids = _post(client, users[1], 3)
+    page = _changes(client, users[0])
+    assert _ops(page['changes']) == [(entry_id, 'upsert') for entry_id in ids]
+    assert page['next_since'] == page['changes'][-1]['seq'] and not page['has_more']
+    assert page['changes'][0]['entry'] == client.get(f'/entries/{ids[0]}', headers=users[0]).get_json()
+
+    # nothing new: the same cursor comes back
+    assert _changes(client, users[0], page['next_since']) == {'changes': [], 'next_since': page['next_since'], 'has_more': False}
+
+
+def test_cursor_with_shards(app, client, users, reshard):
+    reshard(2)
+    first = _post(client, users[1])
+    second = _post(client, users[3])
+    with app.app_context():
+        assert [sharding.shard_for(2), sharding.shard_for(4)] == [1, 0]
+
+    page = _changes(client, users[0])
+    shard_0, shard_1 = (int(seq) for seq in page['next_since'].split('.'))
+    assert shard_0 > 0 and shard_1 > 0
+    # shards are drained in order
+    assert _ops(page['changes']) == [(second[0], 'upsert'), (first[0], 'upsert')]
+    assert _changes(client, users[0], page['next_since'])['changes'] == []
+
+    # a regular user only reads their own shard, the cursor still has one seq per shard
+    own = _changes(client, users[1])
+    assert _ops(own['changes']) == [(first[0], 'upsert')]
+    assert own['next_since'].split('.')[1] == str(shard_1)
+
+
+@pytest.mark.parametrize('shards', [0, 2])
+def test_paging_at_limit(client, users, reshard, shards):
+    if shards:
+        reshard(shards)
+    ids = _post(client, users[1], 3) + _post(client, users[3], 2)
+
+    pages = _sync(client, users[0], limit=2)
+    assert [len(page['changes']) for page in pages] == [2, 2, 1]
+    assert [page['has_more'] for page in pages] == [True, True, False]
+    assert sorted(entry_id for page in pages for entry_id, _ in _ops(page['changes'])) == sorted(ids)
+
+    # a page exactly at limit with nothing after it
+    assert _changes(client, users[0], pages[1]['next_since'], limit=1)['has_more'] is False
+
+
+@pytest.mark.parametrize('since', ['abc', '-1', '1.x', ''])
+def test_bad_cursor(client, users, since):
+    response = client.get(f'/entries/changes?since={since}', headers=users[0])
+    assert response.status_code == 400
+
+
+def test_bad_limit(client, users):
+    assert client.get('/entries/changes?since=0&limit=0', headers=users[0]).status_code == 400
+
+
+def test_cursor_expires_after_a_reset(client, users, reshard):
+    _post(client, users[1], 2)
+    before = _changes(client, users[0])['next_since']
+
+    reshard(2)
+    # a cursor of the main database cannot be used with shards
+    assert client.get(f'/entries/changes?since={before}', headers=users[0]).status_code == 410
+    assert client.get('/entries/changes?since=5.5.5', headers=users[0]).status_code == 410
+    sharded = _changes(client, users[0])['next_since']
+
+    reshard(0)
+    assert client.get(f'/entries/changes?since={before}', headers=users[0]).status_code == 410
+    assert client.get(f'/entries/changes?since={sharded}', headers=users[0]).status_code == 410
+    # starting over works, and so does the cursor it returns
+    page = _changes(client, users[0])
+    assert len(page['changes']) == 2
+    assert _changes(client, users[0], page['next_since'])['changes'] == []
+
+
+@pytest.mark.parametrize('shards', [0, 2])
+def test_tombstones(client, users, reshard, shards):
+    if shards:
+        reshard(shards)
+    kept, deleted = _post(client, users[1], 2)
+    gone = _post(client, users[3], 2)
+    since = _changes(client, users[0])['next_since']
+
+    assert client.delete(f'/entries/{deleted}', headers=users[1]).status_code == 200
+    assert client.delete('/users/4', headers=users[0]).status_code == 200
+
+    changes = _changes(client, users[0], since)['changes']
+    assert sorted(_ops(changes)) == sorted([(deleted, 'delete')] + [(entry_id, 'delete') for entry_id in gone])
+    assert all(change['entry'] is None for change in changes)
+    assert {change['user_id'] for change in changes} == {2, 4}
+    # the full feed keeps the upsert of the entry that is left
+    assert (kept, 'upsert') in _ops(_changes(client, users[0])['changes'])
+
+
+@pytest.mark.parametrize('shards', [0, 2])
+def test_each_user_sees_their_own_changes(client, users, reshard, shards):
+    if shards:
+        reshard(shards)
+    own = _post(client, users[1])
+    same_shard = _post(client, users[2])
+    other_shard = _post(client, users[3])
+
+    assert _ops(_changes(client, users[1])['changes']) == [(own[0], 'upsert')]
+    assert _ops(_changes(client, users[2])['changes']) == [(same_shard[0], 'upsert')]
+    assert _ops(_changes(client, users[3])['changes']) == [(other_shard[0], 'upsert')]
+    everything = _changes(client, users[0])['changes']
+    assert sorted(entry_id for entry_id, _ in _ops(everything)) == sorted(own + same_shard + other_shard)
+    assert {change['user_id'] for change in everything} == {2, 3, 4}
@@ -0,0 +1,69 @@
+import pytest
+import foods
+from models import db
+from models.entry import Entry
+from models.food import Food
+
+
+@pytest.fixture
+def small_cache():
+    foods.configure(2)
+    yield
+    foods.configure(10000)
+
+
+def test_entries_return_their_own_text(app, client, login):
+    first, second = login('a'), login('b')
+    created = [client.post('/entries', json={'text': text, 'calories': 5}, headers=headers).get_json()
+               for text, headers in [('Coffee', first), ('coffee', second), (' coffee ', second)]]
+    assert [entry['text'] for entry in created] == ['Coffee', 'coffee', ' coffee ']
+
+    foods.clear()
+    listed = client.get('/entries?per_page=100', headers=second).get_json()['entries']
+    assert [entry['text'] for entry in listed] == ['coffee', ' coffee ']
+    assert client.get(f"/entries/{created[0]['id']}", headers=first).get_json()['text'] == 'Coffee'
+
+    # the key groups the spellings for per-food totals
+    with app.app_context():
+        per_food = db.session.execute(
+            db.select(Food.key, db.func.count(), db.func.sum(Entry.calories))
+            .join(Entry, Entry.food_id == Food.id).group_by(Food.key)
+        ).all()
+    assert per_food == [('coffee', 3, 15)]
+
+
+def test_update_with_a_new_text(app, client, login):
+    result = app.test_cli_runner().invoke(args=['nutrition', 'import', 'data/nutrition.csv', '--replace'])
+    assert result.exit_code == 0, result.output
+    headers = login('a')
+    created = client.post('/entries', json={'text': '1 apple'}, headers=headers).get_json()
+
+    response = client.put(f"/entries/{created['id']}", json={'text': '2 bananas'}, headers=headers)
+    assert response.status_code == 200
+    updated = response.get_json()
+    assert updated['text'] == '2 bananas' and updated['calories'] > 0
+    with app.app_context():
+        stored = db.session.execute(db.select(Food.calories).where(Food.text == '2 bananas')).scalar()
+    assert stored == updated['calories']
+
+
+def test_cache_keeps_the_most_recently_used_foods(app, small_cache):
+    with app.app_context():
+        first, second = foods.intern('egg'), foods.intern('rice')
+        assert foods.cached_text(first) == 'egg'
+        third = foods.intern('tea')
+        assert foods.cached_text(second) is None and foods.cached_id('rice') is None
+        assert foods.cached_id('egg') == first and foods.cached_text(third) == 'tea'
+        assert foods.intern('rice') == second and foods.intern('Rice') != second
+
+
+def test_pages_with_more_foods_than_the_cache(app, client, login, small_cache):
+    headers = login('admin', 'admin')
+    for text in ['egg', 'rice', 'tea', 'milk']:
+        client.post('/entries', json={'text': text, 'calories': 10}, headers=headers)
+    foods.clear()
+
+    listed = client.get('/entries?per_page=100', headers=headers).get_json()['entries']
+    assert [entry['text'] for entry in listed] == ['egg', 'rice', 'tea', 'milk']
+    columns = client.get('/entries?per_page=100&format=columnar', headers=headers).get_json()
+    assert columns['entries']['text'] == ['egg', 'rice', 'tea', 'milk']
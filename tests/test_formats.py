@@ -0,0 +1,80 @@
+import asyncio
+import msgpack
+import pytest
+from aio import create_app
+
+ENTRY_FIELDS = {'id', 'date', 'time', 'text', 'calories', 'is_calorie_intake_less_than_expected', 'user_id'}
+USER_FIELDS = {'id', 'name', 'email', 'role', 'expected_daily_calories'}
+LISTS = [('/entries', 'entries', ENTRY_FIELDS), ('/users/list', 'users', USER_FIELDS)]
+
+
+@pytest.fixture
+def headers(client, login):
+    '''an admin with three entries, and a second user'''
+    headers = login('admin', 'admin')
+    login('a')
+    for text, calories in [('egg', 80), ('rice', None), ('tea', 5)]:
+        client.post('/entries', json={'text': text, 'calories': calories}, headers=headers)
+    return headers
+
+
+def _rows(columns):
+    '''columnar page back into rows'''
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
+@pytest.mark.parametrize('url, key, fields', LISTS)
+def test_columnar_has_the_values_of_the_rows(client, headers, url, key, fields):
+    rows = client.get(f'{url}?per_page=1&page=2', headers=headers).get_json()
+    columns = client.get(f'{url}?per_page=1&page=2&format=columnar', headers=headers).get_json()
+    assert set(columns[key]) == fields
+    assert rows[key] and _rows(columns[key]) == rows[key]
+    assert {name: value for name, value in columns.items() if name != key} == \
+           {name: value for name, value in rows.items() if name != key}
+
+
+@pytest.mark.parametrize('url, key, fields', LISTS)
+def test_columnar_empty_page(client, headers, url, key, fields):
+    columns = client.get(f'{url}?username=nobody&format=columnar', headers=headers).get_json()
+    assert columns[key] == {field: [] for field in fields}
+    assert columns['total_' + key] == 0
+
+
+@pytest.mark.parametrize('url', ['/entries', '/users/list'])
+def test_unknown_format(client, headers, url):
+    response = client.get(f'{url}?format=csv', headers=headers)
+    assert response.status_code == 400
+    assert response.get_json() == {'message': 'Invalid format, use one of: json, columnar'}
+
+
+@pytest.mark.parametrize('accept, mimetype', [
+    ('application/msgpack', 'application/msgpack'),
+    ('application/x-msgpack', 'application/x-msgpack'),
+    ('*/*', 'application/json'),
+    ('application/msgpack;q=0.5, application/json', 'application/json'),
+    ('text/html', 'application/json'),
+])
+@pytest.mark.parametrize('url, key, fields', LISTS)
+def test_accept(client, headers, url, key, fields, accept, mimetype):
+    expected = client.get(f'{url}?format=columnar', headers=headers).get_json()
+    response = client.get(f'{url}?format=columnar', headers={**headers, 'Accept': accept})
+    assert response.status_code == 200 and response.mimetype == mimetype
+    assert 'Accept' in response.headers['Vary']
+    body = response.get_json() if mimetype == 'application/json' else msgpack.unpackb(response.get_data())
+    assert body == expected
+
+
+def test_async_app_negotiates_the_same(app, headers):
+    async def main():
+        async with create_app().test_app() as test_app:
+            client = test_app.test_client()
+            responses = []
+            for accept in ('application/x-msgpack', '*/*'):
+                response = await client.get('/entries?format=columnar', headers={**headers, 'Accept': accept})
+                responses.append((response.mimetype, response.headers['Vary'], await response.get_data()))
+            return responses
+
+    (packed_type, packed_vary, packed), (json_type, json_vary, _) = asyncio.run(main())
+    assert (packed_type, json_type) == ('application/x-msgpack', 'application/json')
+    assert 'Accept' in packed_vary and 'Accept' in json_vary
+    assert msgpack.unpackb(packed)['entries']['text'] == ['egg', 'rice', 'tea']
@@ -0,0 +1,46 @@
+from datetime import date, time
+import pytest
+from sqlalchemy.orm.exc import StaleDataError
+from models import db
+from models.entry import Entry
+from models.user import User
+
+
+@pytest.fixture(params=[False, True], ids=['orm', 'group_commit'])
+def group_commit(request, app):
+    app.config['GROUP_COMMIT'] = request.param
+    yield request.param
+    app.config['GROUP_COMMIT'] = False
+
+
+def _user():
+    user = User(name='a', email='a@test', password_hash='x')
+    user.save()
+    return user
+
+
+def test_insert_and_update(app, group_commit):
+    with app.app_context():
+        user = _user()
+        entry = Entry(date=date(2026, 1, 2), time=time(8), text='egg', calories=80, user_id=user.id)
+        entry.save()
+        assert entry.id == 1
+        entry.calories = 90
+        entry.save()
+        assert db.session.execute(db.select(Entry.calories)).scalar() == 90
+
+
+def test_update_of_a_deleted_row_fails(app, group_commit):
+    with app.app_context():
+        user = _user()
+        entry = Entry(date=date(2026, 1, 2), time=time(8), text='egg', calories=80, user_id=user.id)
+        entry.save()
+        db.session.refresh(entry)
+        # deleted by another request while this one holds the loaded entry
+        with db.engine.begin() as connection:
+            connection.execute(Entry.__table__.delete())
+        entry.calories = 90
+        with pytest.raises(StaleDataError):
+            entry.save()
+        db.session.rollback()
+        assert db.session.execute(db.select(db.func.count()).select_from(Entry)).scalar() == 0
@@ -0,0 +1,101 @@
+from collections import namedtuple
+import pytest
+from nutrition import FoodIndex, _calories_for, normalize, parse_quantity
+from models.nutrition import NutritionFact
+
+Fact = namedtuple('Fact', 'id name calories unit quantity grams')
+
+FACTS = [
+    Fact(1, 'apple', 95, 'piece', 1, 182),
+    Fact(2, 'apple pie', 296, 'slice', 1, 125),
+    Fact(3, 'chicken', 335, 'bowl', 1, 140),
+    Fact(4, 'rice', 206, 'cup', 1, 158),
+]
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('4 bowls chicken', (4.0, 'bowl', None, 'chicken')),
+    ('200g rice', (200.0, 'g', 1, 'rice')),
+    ('1 1/2 cups yogurt', (1.5, 'cup', None, 'yogurt')),
+    ('1/2 plate of rice', (0.5, 'plate', None, 'rice')),
+    ('.5 kg rice', (0.5, 'g', 1000, 'rice')),
+    ('two slices apple pie', (2.0, 'slice', None, 'apple pie')),
+    ('apple', (1.0, None, None, 'apple')),
+    ('  Rice  ', (1.0, None, None, 'rice')),
+    ('bowl', (1.0, None, None, 'bowl')),
+])
+def test_parse_quantity(text, expected):
+    assert parse_quantity(text) == expected
+
+
+@pytest.mark.parametrize('text', ['1/0 apple', '1 0/0 apple', '0/0 apple'])
+def test_parse_quantity_zero_denominator(text):
+    assert parse_quantity(text) == (1.0, None, None, 'apple')
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('Eggs!', 'egg'),
+    ('Berries', 'berry'),
+    ('glass', 'glass'),
+    ('  Apple-Pie  ', 'apple pie'),
+    ('2 Cups', '2 cup'),
+    ('', ''),
+])
+def test_normalize(text, expected):
+    assert normalize(text) == expected
+
+
+def test_food_index_exact_match():
+    index = FoodIndex(FACTS)
+    assert len(index) == 4
+    assert index.match('Apples') == (FACTS[0], 1.0)
+
+
+def test_food_index_fuzzy_match():
+    fact, confidence = FoodIndex(FACTS).match('chiken')
+    assert fact is FACTS[2]
+    assert 0 < confidence < 1
+
+
+def test_food_index_prefers_closest_name():
+    fact, _ = FoodIndex(FACTS).match('apple pies')
+    assert fact is FACTS[1]
+
+
+def test_food_index_no_match():
+    assert FoodIndex(FACTS).match('xyz') == (None, 0.0)
+    assert FoodIndex([]).match('apple') == (None, 0.0)
+
+
+def test_serving_without_a_quantity_is_not_divided():
+    fact = Fact(5, 'chicken', 250, 'bowl', 0, 0)
+    assert _calories_for(fact, 2, 'bowl', None) == (500, 0.8)
+
+
+def _import(app, tmp_path, lines):
+    path = tmp_path / 'facts.csv'
+    path.write_text('name,calories,unit,quantity,grams\n' + ''.join(line + '\n' for line in lines))
+    return app.test_cli_runner().invoke(args=['nutrition', 'import', str(path)])
+
+
+@pytest.mark.parametrize('line, error', [
+    ('chicken,250,bowl,0,0', 'line 3: quantity must be above 0, got 0'),
+    ('chicken,250,bowl,1,0', 'line 3: grams must be above 0, got 0'),
+    ('chicken,lots,bowl,1,140', "line 3: calories is not a number: 'lots'"),
+    ('chicken,-5,bowl,1,140', 'line 3: calories must be at least 0, got -5'),
+    ('chicken,250,bowl,nan,140', 'line 3: quantity must be above 0, got nan'),
+])
+def test_import_refuses_unusable_rows(app, tmp_path, line, error):
+    result = _import(app, tmp_path, ['rice,206,cup,1,158', line])
+    assert result.exit_code == 1
+    assert f'Error: {error}' in result.output
+    with app.app_context():
+        assert NutritionFact.query.count() == 0
+
+
+def test_imported_facts_resolve_entries(app, client, login, tmp_path):
+    result = _import(app, tmp_path, ['chicken,250,bowl,1,', 'rice,206,cup,,158'])
+    assert result.exit_code == 0, result.output
+    headers = login('a')
+    created = client.post('/entries', json={'text': '2 bowls chicken'}, headers=headers)
+    assert created.status_code == 201 and created.get_json()['calories'] == 500
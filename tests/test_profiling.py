@@ -0,0 +1,52 @@
+import os
+import profiling
+
+
+def _traces(tmp_path, count):
+    for index in range(count):
+        path = tmp_path / f'{index}.prof'
+        path.write_bytes(b'')
+        os.utime(path, (index, index))
+
+
+def test_rotate_keeps_the_newest(tmp_path):
+    _traces(tmp_path, 5)
+    profiling._rotate(str(tmp_path), 2)
+    assert sorted(os.listdir(tmp_path)) == ['3.prof', '4.prof']
+
+
+def test_rotate_races_with_another_worker(tmp_path, monkeypatch):
+    '''the other worker removes traces between the listing, the stat and the remove'''
+    _traces(tmp_path, 5)
+    scandir, remove = os.scandir, os.remove
+
+    def listing(directory):
+        entries = list(scandir(directory))
+        remove(tmp_path / '1.prof')
+        return entries
+
+    def removing(path):
+        if path.endswith('0.prof'):
+            remove(path)
+        remove(path)
+
+    monkeypatch.setattr(profiling.os, 'scandir', listing)
+    monkeypatch.setattr(profiling.os, 'remove', removing)
+    profiling._rotate(str(tmp_path), 2)
+    assert sorted(os.listdir(tmp_path)) == ['3.prof', '4.prof']
+
+
+def test_profiled_request_survives_a_concurrent_rotation(app, client, login, monkeypatch, tmp_path):
+    headers = login('admin', 'admin')
+    monkeypatch.setitem(app.config, 'PROFILE_DIR', str(tmp_path))
+    monkeypatch.setitem(app.config, 'PROFILE_MAX_FILES', 0)
+    remove = os.remove
+
+    def removed_by_another_worker(path):
+        remove(path)
+        remove(path)
+
+    monkeypatch.setattr(profiling.os, 'remove', removed_by_another_worker)
+    response = client.get('/entries', headers={**headers, 'X-Profile': '1'})
+    assert response.status_code == 200 and response.headers['X-Profile-File']
+    assert os.listdir(tmp_path) == []
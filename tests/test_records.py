@@ -0,0 +1,72 @@
+from datetime import date, time, timedelta
+import pytest
+import records
+import sharding
+from models import archive, db
+from models.archive import ArchivedEntry
+from models.entry import Entry
+from models.user import User
+
+OLD = date.today() - timedelta(days=400)
+
+
+@pytest.fixture
+def entries(app, login, reshard, request):
+    '''
+        entries of two users with a daily limit of 300: days whose total is split between
+        archived and hot rows (one of them over the limit), entries without calories
+    '''
+    login('a')
+    login('b')
+    result = app.test_cli_runner().invoke(args=['nutrition', 'import', 'data/nutrition.csv'])
+    assert result.exit_code == 0, result.output
+    if request.param:
+        reshard(request.param)
+    with app.app_context():
+        for user in User.query.all():
+            user.expected_daily_calories = 300
+            user.save()
+        for day, text, calories, user_id in [
+            (OLD, 'egg', 100, 1), (OLD, 'rice', 150, 1), (OLD, 'tea', 200, 2),
+            (date.today(), 'egg', 250, 1), (date.today(), 'zzq', None, 2), (date.today(), 'egg', 20, 2),
+        ]:
+            Entry(date=day, time=time(8), text=text, calories=calories, user_id=user_id).save()
+    result = app.test_cli_runner().invoke(args=['archive', 'run', '--days', '30'])
+    assert result.exit_code == 0, result.output
+
+    with app.app_context():
+        # hot rows of archived days; the banana (105) has no calories, it is over the limit
+        # of user 2 on its own while the archived entry of that day is not
+        for text, calories, user_id in [('egg', 60, 1), ('1 banana', 30, 2)]:
+            Entry(date=OLD, time=time(20), text=text, calories=calories, user_id=user_id).save()
+        for session in sharding.all_sessions():
+            session.execute(db.update(Entry).where(Entry.calories == 30).values(calories=None))
+            session.commit()
+
+
+@pytest.mark.parametrize('entries', [0, 2], indirect=True, ids=['main', 'sharded'])
+def test_rows_serialize_like_the_model(app, entries):
+    with app.app_context():
+        rows = []
+        for session in sharding.all_sessions():
+            source = archive.entry_source(True)
+            rows += session.execute(db.select(*records.entry_columns(source))).all()
+        rows.sort(key=lambda row: row.id)
+        serialized = records.serialize_entries(rows)
+        table = records.entry_table(rows)
+
+        expected = []
+        for row in rows:
+            session = sharding.session_for(row.user_id)
+            entry = session.get(Entry, row.id) or session.get(ArchivedEntry, row.id)
+            expected.append(entry.serialize())
+            session.rollback()
+
+    assert serialized == expected
+    assert [{field: table[field][index] for field in table} for index in range(len(rows))] == expected
+    # the cases the fixture is about are in the rows
+    assert any(entry['calories'] is None for entry in expected)
+    assert {entry['is_calorie_intake_less_than_expected'] for entry in expected} == {True, False}
+    old = {(entry['user_id'], entry['is_calorie_intake_less_than_expected']) for entry in expected
+           if entry['date'] == OLD.isoformat()}
+    assert old == {(1, False), (2, True), (2, False)}
@@ -0,0 +1,104 @@
+from datetime import date, time, timedelta
+import pytest
+import sharding
+from models import db
+from models.entry import Entry
+
+# with 2 shards users 1-3 are in shard 1 and users 4-6 in shard 0
+
+
+@pytest.fixture
+def users(login, reshard):
+    '''an admin (id 1) and regular users 2 to 5 on two shards, as Authorization headers'''
+    headers = [login('admin', 'admin')] + [login(name) for name in 'abcd']
+    reshard(2)
+    return headers
+
+
+def _post(client, headers, count):
+    return [client.post('/entries', json={'text': 'egg', 'calories': 10}, headers=headers).get_json()['id']
+            for _ in range(count)]
+
+
+def _ids(page):
+    return [entry['id'] for entry in page['entries']]
+
+
+@pytest.fixture
+def fan_outs(monkeypatch):
+    '''shards each fan_out of the request is sent to'''
+    calls = []
+    fan_out = sharding.fan_out
+
+    def recording(func, shards=None):
+        calls.append(shards)
+        return fan_out(func, shards)
+    monkeypatch.setattr(sharding, 'fan_out', recording)
+    return calls
+
+
+def test_pages_merge_several_shards(client, users, fan_outs):
+    entries = _post(client, users[1], 3) + _post(client, users[3], 3)
+    everything = client.get('/entries?per_page=100', headers=users[0]).get_json()
+    assert _ids(everything) == sorted(entries) and everything['total_entries'] == 6
+    assert fan_outs == [None]
+
+    # ids of the two shards interleave, page 2 takes one entry of each
+    page = client.get('/entries?per_page=2&page=2', headers=users[0]).get_json()
+    assert _ids(page) == sorted(entries)[2:4]
+    assert {entry['user_id'] for entry in page['entries']} == {2, 4}
+    assert (page['total_entries'], page['has_prev'], page['has_next']) == (6, True, True)
+
+    last = client.get('/entries?per_page=4&page=2', headers=users[0]).get_json()
+    assert _ids(last) == sorted(entries)[4:] and not last['has_next']
+    assert client.get('/entries?per_page=4&page=3', headers=users[0]).status_code == 404
+    assert client.get('/entries?per_page=0', headers=users[0]).status_code == 404
+
+
+def test_user_filters_pick_the_shards(client, users, fan_outs):
+    _post(client, users[1], 2)
+    _post(client, users[3], 1)
+
+    # admin filtered on users of one shard
+    page = client.get('/entries?username=c', headers=users[0]).get_json()
+    assert page['total_entries'] == 1 and fan_outs[-1] == [0]
+
+    # regular users only read their own shard
+    own = client.get('/entries?per_page=100', headers=users[1]).get_json()
+    assert own['total_entries'] == 2 and {entry['user_id'] for entry in own['entries']} == {2}
+    assert fan_outs[-1] == [1]
+    assert client.get('/entries', headers=users[2]).get_json()['total_entries'] == 0
+    assert fan_outs[-1] == [1]
+    # ... and see nothing of others when filtering on their name
+    assert client.get('/entries?username=c', headers=users[1]).get_json()['total_entries'] == 0
+    assert fan_outs[-1] == []
+
+
+def _counts(app, user_id):
+    '''rows of a user in each shard table'''
+    with app.app_context():
+        session = sharding.session_for(user_id)
+        counts = {}
+        for name in sharding.SHARD_TABLES:
+            table = db.metadata.tables[name]
+            counts[name] = session.execute(
+                db.select(db.func.count()).select_from(table).where(table.c.user_id == user_id)
+            ).scalar()
+        return counts
+
+
+def test_deleting_a_user_removes_their_shard_rows(app, client, users):
+    with app.app_context():
+        for user_id in (2, 4):
+            Entry(date=date.today() - timedelta(days=400), time=time(8), text='egg', calories=5, user_id=user_id).save()
+    result = app.test_cli_runner().invoke(args=['archive', 'run', '--days', '30'])
+    assert result.exit_code == 0, result.output
+    _post(client, users[1], 1)
+    _post(client, users[3], 2)
+    assert set(_counts(app, 4).values()) == {1, 2}
+
+    assert client.delete('/users/4', headers=users[0]).status_code == 200
+    assert set(_counts(app, 4).values()) == {0}
+    # the other user of that shard and the other shard are untouched
+    assert _counts(app, 2) == {name: 1 for name in sharding.SHARD_TABLES}
+    assert client.get('/entries?per_page=100', headers=users[0]).get_json()['total_entries'] == 2